@@ -1,3 +1,23 @@
 #!/bin/sh
-python ./manage.py migrate
-python ./manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+# Usage: entrypoint.sh [dev|prod|migrate|scheduler]
+#   dev        apply migrations and run the development server (default)
+#   prod       run gunicorn with ASGI workers, see gunicorn.conf.py
+#   migrate    apply migrations and collect static files, then exit
+#   scheduler  open and close polls as their dates pass, every minute
+set -e
+case "${1:-${APP_MODE:-dev}}" in
+  migrate)
+    python ./manage.py migrate --noinput
+    python ./manage.py collectstatic --noinput
+    ;;
+  scheduler)
+    exec python ./manage.py update_poll_status --interval 60
+    ;;
+  prod)
+    exec gunicorn mysite.asgi:application -c gunicorn.conf.py
+    ;;
+  *)
+    python ./manage.py migrate
+    exec python ./manage.py runserver 0.0.0.0:8000
+    ;;
+esac
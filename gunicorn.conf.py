@@ -0,0 +1,28 @@
+"""Gunicorn settings for running KU Polls in production.
+
+Every value can be overridden from the environment. Send SIGHUP to the
+master process to reload the workers gracefully.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# ASGI workers, so the live results stream can hold many connections.
+# mysite/settings.py reads WEB_CONCURRENCY with the same default.
+worker_class = os.environ.get("WORKER_CLASS",
+                              "uvicorn_worker.UvicornWorker")
+workers = int(os.environ.get("WEB_CONCURRENCY",
+                             multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("WORKER_THREADS", 1))
+
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+
+# Recycle workers now and then so slow leaks cannot build up.
+max_requests = int(os.environ.get("MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 200))
+
+accesslog = os.environ.get("ACCESS_LOG", "-")
+errorlog = "-"
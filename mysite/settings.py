@@ -9,9 +9,11 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
-from decouple import config, Csv
+from decouple import config, Choices, Csv
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 import logging
+import multiprocessing
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,6 +55,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Opt-in query counts and timings per URL name, sent back as Server-Timing
+# headers; see "manage.py request_metrics".
+POLLS_REQUEST_METRICS = config('POLLS_REQUEST_METRICS', default=False,
+                               cast=bool)
+if POLLS_REQUEST_METRICS:
+    MIDDLEWARE.insert(0, 'polls.middleware.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -72,19 +82,148 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+# Worker processes per host, with the same default as gunicorn.conf.py.
+WEB_CONCURRENCY = config('WEB_CONCURRENCY',
+                         default=multiprocessing.cpu_count() * 2 + 1,
+                         cast=int)
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections come from a psycopg 3 pool in each process by default. Set
+# DATABASE_POOL=False to use CONN_MAX_AGE persistent connections instead.
+# Sync views run on one thread per ASGI worker, so a small pool is enough.
+# A host opens up to WEB_CONCURRENCY * DATABASE_POOL_MAX_SIZE connections,
+# which must stay below PostgreSQL's max_connections (100 by default) with
+# room left for the management commands. CONN_HEALTH_CHECKS makes Django
+# pass the pool a connection check.
+DATABASE_ENGINE = config("DATABASE_ENGINE",
+                         default="django.db.backends.postgresql")
+DATABASE_POOL = config("DATABASE_POOL", default=True, cast=bool)
+
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": DATABASE_ENGINE,
         "NAME": config("DATABASE_NAME", default="pollsdb"),
         "USER": config("DATABASE_USER", default="pollsapp"),
         "PASSWORD": config("DATABASE_PASSWORD", default="password"),
         "HOST": config("DATABASE_HOST", default="localhost"),
-        "PORT": config("DATABASE_PORT", default="5432")
+        "PORT": config("DATABASE_PORT", default="5432"),
+        "CONN_HEALTH_CHECKS": True,
+        "CONN_MAX_AGE": 0 if DATABASE_POOL else config(
+            "DATABASE_CONN_MAX_AGE", default=60, cast=int),
+        "OPTIONS": {
+            "pool": {
+                "min_size": config("DATABASE_POOL_MIN_SIZE", default=1,
+                                   cast=int),
+                "max_size": config("DATABASE_POOL_MAX_SIZE", default=4,
+                                   cast=int),
+                "timeout": config("DATABASE_POOL_TIMEOUT", default=10,
+                                  cast=float),
+            },
+        } if DATABASE_POOL else {},
+    }
+}
+
+if DATABASE_ENGINE == "django.db.backends.sqlite3":
+    # For local benchmarks; the database is a file in the project folder.
+    DATABASES["default"] = {
+        "ENGINE": DATABASE_ENGINE,
+        "NAME": BASE_DIR / config("DATABASE_NAME", default="db.sqlite3"),
+        # Take the write lock up front so concurrent votes wait for it
+        # instead of failing with "database is locked".
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
     }
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) when running
+# more than one process.
+
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="ku-polls"),
+    },
+}
+
+# Sessions get their own alias so they can live in a different store.
+LOCAL_CACHE_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+SESSION_CACHE_BACKEND = config("SESSION_CACHE_BACKEND",
+                               default=LOCAL_CACHE_BACKEND)
+CACHES["sessions"] = {
+    "BACKEND": SESSION_CACHE_BACKEND,
+    "LOCATION": config("SESSION_CACHE_LOCATION", default="ku-polls-sessions"),
+}
+
+# Sessions
+# https://docs.djangoproject.com/en/5.1/topics/http/sessions/
+# SESSION_MODE is one of:
+#   db              every request reads django_session (default with the
+#                   local memory session cache)
+#   cached_db       reads come from the cache, writes go to both (default
+#                   with a shared SESSION_CACHE_BACKEND such as Redis)
+#   cache           cache only; use a shared, persistent cache backend
+#   signed_cookies  no server-side storage at all
+# The local memory cache belongs to one process: a logout in one worker
+# would not reach the others, so the cache modes need a shared backend
+# unless WEB_CONCURRENCY is set to 1.
+# Expired rows of the db modes are removed by "manage.py purge_sessions".
+
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
 }
+SESSION_MODE = config(
+    'SESSION_MODE',
+    default='db' if SESSION_CACHE_BACKEND == LOCAL_CACHE_BACKEND
+    else 'cached_db',
+    cast=Choices(list(SESSION_ENGINES)))
+if (SESSION_MODE in ("cached_db", "cache")
+        and SESSION_CACHE_BACKEND == LOCAL_CACHE_BACKEND
+        and WEB_CONCURRENCY > 1):
+    raise ImproperlyConfigured(
+        f"SESSION_MODE={SESSION_MODE} needs a shared SESSION_CACHE_BACKEND "
+        f"unless WEB_CONCURRENCY=1 (the default is 2 * CPU cores + 1).")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = "sessions"
+
+# Flash messages travel in a cookie, so showing one never touches the
+# session.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Questions per page of the poll index.
+POLLS_INDEX_PAGE_SIZE = config('POLLS_INDEX_PAGE_SIZE', default=10, cast=int)
+
+# Most votes accepted by one batch vote request.
+POLLS_VOTE_BATCH_LIMIT = config('POLLS_VOTE_BATCH_LIMIT', default=1000,
+                                cast=int)
+
+# Write-behind vote buffer: a file path turns it on. Votes are acknowledged
+# once they are in this local journal and written to the database in
+# batches of POLLS_VOTE_BUFFER_BATCH every POLLS_VOTE_BUFFER_INTERVAL
+# seconds.
+POLLS_VOTE_BUFFER = config('POLLS_VOTE_BUFFER', default='')
+POLLS_VOTE_BUFFER_INTERVAL = config('POLLS_VOTE_BUFFER_INTERVAL',
+                                    default=0.5, cast=float)
+POLLS_VOTE_BUFFER_BATCH = config('POLLS_VOTE_BUFFER_BATCH', default=500,
+                                 cast=int)
+
+# Seconds the poll index stays cached when no poll is scheduled sooner.
+POLLS_INDEX_CACHE_TIMEOUT = config('POLLS_INDEX_CACHE_TIMEOUT', default=300,
+                                   cast=int)
+
+# Seconds a closed poll's results stay cached and browsers may reuse them.
+# The cache is per process, so other workers keep showing the frozen
+# results of a reopened poll for up to this long.
+POLLS_SNAPSHOT_CACHE_TIMEOUT = config('POLLS_SNAPSHOT_CACHE_TIMEOUT',
+                                      default=300, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -104,6 +243,64 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PASSWORD_HASHER_PROFILE picks the hasher for new passwords:
+#   default  Django's PBKDF2
+#   argon2   Argon2id with the ARGON2_* costs (needs argon2-cffi)
+#   scrypt   scrypt with the SCRYPT_* costs
+#   fast     salted MD5, quick and weak, only for tests and load tests
+# The other hashers stay listed so existing passwords still work; a
+# password hashed another way is rehashed when its user logs in. MD5 comes
+# last in every profile, so users whose passwords were hashed under fast
+# (e.g. by "benchmark --seed") can still log in after a switch.
+
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', default=2, cast=int)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', default=19456, cast=int)
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', default=1, cast=int)
+SCRYPT_WORK_FACTOR = config('SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+SCRYPT_BLOCK_SIZE = config('SCRYPT_BLOCK_SIZE', default=8, cast=int)
+SCRYPT_PARALLELISM = config('SCRYPT_PARALLELISM', default=1, cast=int)
+
+PASSWORD_HASHER_CHOICES = {
+    "default": 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    "argon2": 'polls.hashers.TunedArgon2PasswordHasher',
+    "scrypt": 'polls.hashers.TunedScryptPasswordHasher',
+    "fast": 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+PASSWORD_HASHER_PROFILES = {
+    profile: [hasher] + [other for other in PASSWORD_HASHER_CHOICES.values()
+                         if other != hasher]
+    for profile, hasher in PASSWORD_HASHER_CHOICES.items()
+}
+PASSWORD_HASHER_PROFILE = config(
+    'PASSWORD_HASHER_PROFILE', default='default',
+    cast=Choices(list(PASSWORD_HASHER_PROFILES)))
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+
+# Logging
+# Records go to general.log and events.log. With LOG_ASYNC (the default)
+# the request thread only puts records on a queue and a background thread
+# writes them.
+# Every server process appends to the same files, so they are rotated from
+# outside by logrotate (LOG_ROTATE=external, the default); the handlers
+# reopen a file that was moved away. LOG_ROTATE=size rotates at
+# LOG_MAX_BYTES from inside Django, which is only safe with one process,
+# e.g. runserver.
+
+LOG_ASYNC = config('LOG_ASYNC', default=True, cast=bool)
+LOG_ROTATE = config('LOG_ROTATE', default='external',
+                    cast=Choices(['external', 'size']))
+LOG_MAX_BYTES = config('LOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+LOG_BACKUP_COUNT = config('LOG_BACKUP_COUNT', default=5, cast=int)
+if LOG_ROTATE == 'size':
+    LOG_FILE_HANDLER = {
+        "class": "logging.handlers.RotatingFileHandler",
+        "maxBytes": LOG_MAX_BYTES,
+        "backupCount": LOG_BACKUP_COUNT,
+    }
+else:
+    LOG_FILE_HANDLER = {"class": "logging.handlers.WatchedFileHandler"}
+
 LOGGING = {
 
     "version": 1,  # the dictConfig format version
@@ -112,10 +309,16 @@ LOGGING = {
 
     "loggers": {
         "polls": {
-            "handlers": ["file"],
+            "handlers": ["queue" if LOG_ASYNC else "file"],
             "level": "DEBUG",
             "propagate": True,
         },
+        # Structured records of logins, logouts and votes.
+        "polls.events": {
+            "handlers": ["queue_events" if LOG_ASYNC else "events"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 
     "formatters": {
@@ -127,15 +330,35 @@ LOGGING = {
                 "format": "{levelname} {message}",
                 "style": "{",
             },
+            "json": {
+                "()": "polls.log.JsonFormatter",
+            },
         },
 
     "handlers": {
+        "events": {
+            **LOG_FILE_HANDLER,
+            "filename": "events.log",
+            "delay": True,
+            "level": "INFO",
+            "formatter": "json",
+        },
         "file": {
-            "class": "logging.FileHandler",
+            **LOG_FILE_HANDLER,
             "filename": "general.log",
+            "delay": True,
             "level": "DEBUG",
             "formatter": "verbose",
         },
+        # The queue handlers must sort after the handlers they feed.
+        "queue": {
+            "()": "polls.log.QueueListenerHandler",
+            "handlers": ["cfg://handlers.file"],
+        },
+        "queue_events": {
+            "()": "polls.log.QueueListenerHandler",
+            "handlers": ["cfg://handlers.events"],
+        },
       },
 }
 
@@ -155,6 +378,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# In production use whitenoise.storage.CompressedManifestStaticFilesStorage
+# to serve hashed, pre-compressed files after collectstatic.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": config(
+            'STATICFILES_STORAGE',
+            default='django.contrib.staticfiles.storage.StaticFilesStorage'),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -1,7 +1,116 @@
-"""Import django admin package."""
+"""Admin pages for questions, choices and votes."""
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Sum
+from django.utils.functional import cached_property
 
-from .models import Question, Choice
+from .models import Question, Choice, Vote
 
-admin.site.register(Question)
-admin.site.register(Choice)
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator that estimates the size of big unfiltered tables.
+
+    On PostgreSQL the planner's row estimate of the table replaces the
+    COUNT(*) when it is above ``exact_limit``; filtered lists and small
+    tables are still counted exactly.
+    """
+
+    exact_limit = 100_000
+
+    @cached_property
+    def count(self):
+        """Return the estimated or exact number of objects."""
+        if not self.object_list.query.where:
+            estimate = self.estimate()
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        return super().count
+
+    def estimate(self):
+        """Return the planner's row estimate of the table, or None."""
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class "
+                           "WHERE oid = %s::regclass",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
+
+
+class ChoiceInline(admin.TabularInline):
+    """Edit the choices on the page of their question."""
+
+    model = Choice
+    extra = 0
+    readonly_fields = ("vote_count",)
+
+
+@admin.register(Question)
+class QuestionAdmin(admin.ModelAdmin):
+    """Questions with their vote totals."""
+
+    list_display = ("question_text", "pub_date", "end_date", "status",
+                    "total_votes")
+    list_filter = ("status",)
+    search_fields = ("question_text",)
+    ordering = ("-pub_date", "-id")
+    readonly_fields = ("status",)
+    inlines = (ChoiceInline,)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Add the vote total from the choice counters."""
+        return super().get_queryset(request).annotate(
+            total_votes=Sum("choice__vote_count", default=0))
+
+    @admin.display(ordering="total_votes", description="votes")
+    def total_votes(self, question):
+        """Return the annotated vote total."""
+        return question.total_votes
+
+
+@admin.register(Choice)
+class ChoiceAdmin(admin.ModelAdmin):
+    """Choices with their vote counters."""
+
+    list_display = ("choice_text", "question", "vote_count")
+    list_select_related = ("question",)
+    search_fields = ("choice_text",)
+    autocomplete_fields = ("question",)
+    readonly_fields = ("vote_count",)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Vote)
+class VoteAdmin(admin.ModelAdmin):
+    """Read-only list of votes.
+
+    Votes are changed through Vote.objects.cast() so the choice counters
+    stay right; use rebuild_vote_counts after fixing rows by hand.
+    """
+
+    list_display = ("id", "user", "question", "choice", "updated_at")
+    list_select_related = ("user", "question", "choice")
+    raw_id_fields = ("user", "question", "choice")
+    search_fields = ("=user__username",)
+    ordering = ("-id",)
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        """Votes are only cast by users."""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Votes are only changed by users."""
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        """Votes are only removed with their user, question or choice."""
+        return False
@@ -0,0 +1,271 @@
+"""Read-only JSON API for polls and results, plus voting by JSON POST."""
+import hashlib
+import json
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET, require_POST
+
+from django.db import transaction
+
+from .broadcast import broadcaster
+from .cache import cache_snapshot, get_cached_snapshot
+from .models import Choice, Question, Vote, VoteRollup
+from .pagination import keyset_page
+from .voters import resolve_users, user_key
+from .views import event_logger, record_vote
+
+
+def conditional_json(request, data, last_modified=None):
+    """Return data as JSON with an ETag, or 304 if the client has it.
+
+    The ETag is a hash of the body, so it changes exactly when the
+    question or its tallies change.
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder)
+    etag = f'"{hashlib.md5(body.encode()).hexdigest()}"'
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=timestamp)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def question_data(question):
+    """Return the fields of a question shared by every response."""
+    return {
+        "id": question.id,
+        "question_text": question.question_text,
+        "pub_date": question.pub_date,
+        "end_date": question.end_date,
+        "status": question.current_status(),
+    }
+
+
+def error(message, status):
+    """Return a JSON error response."""
+    return JsonResponse({"error": message}, status=status)
+
+
+@require_GET
+def question_list(request):
+    """List published questions, newest first, with keyset cursors."""
+    questions = Question.objects.published()
+    status = request.GET.get("status")
+    if status in (Question.Status.OPEN, Question.Status.CLOSED):
+        questions = questions.filter(status=status)
+    text = request.GET.get("q", "").strip()
+    if text:
+        questions = questions.filter(question_text__icontains=text)
+    page = keyset_page(questions, settings.POLLS_INDEX_PAGE_SIZE,
+                       after=request.GET.get("after"),
+                       before=request.GET.get("before"))
+    data = {
+        "results": [question_data(question) for question in page.items],
+        "next": page.next_cursor,
+        "previous": page.prev_cursor,
+    }
+    last_modified = max((question.updated_at for question in page.items),
+                        default=None)
+    return conditional_json(request, data, last_modified)
+
+
+@require_GET
+def question_detail(request, pk):
+    """Return a question with its choices."""
+    question = get_object_or_404(
+        Question.objects.published().prefetch_related("choice_set"), pk=pk)
+    data = question_data(question)
+    data["can_vote"] = question.can_vote()
+    data["choices"] = [{"id": choice.id, "choice_text": choice.choice_text}
+                       for choice in question.choice_set.all()]
+    return conditional_json(request, data, question.updated_at)
+
+
+@require_GET
+def question_results(request, pk):
+    """Return the vote tallies of a question."""
+    snapshot = get_cached_snapshot(pk)
+    if snapshot is None:
+        question = get_object_or_404(Question.objects.published(), pk=pk)
+        if question.current_status() == Question.Status.CLOSED:
+            snapshot = question.frozen_results()
+            cache_snapshot(snapshot)
+    if snapshot is not None:
+        data = {"question": pk, "total_votes": snapshot.total_votes,
+                "choices": snapshot.choices}
+        return conditional_json(request, data, snapshot.created_at)
+    choices = [{"id": choice.id, "choice_text": choice.choice_text,
+                "vote_count": choice.vote_count,
+                "percentage": choice.percentage}
+               for choice in question.results()]
+    data = {"question": pk,
+            "total_votes": sum(choice["vote_count"] for choice in choices),
+            "choices": choices}
+    return conditional_json(request, data)
+
+
+@require_GET
+def question_trend(request, pk):
+    """Return the vote tallies of a question over time.
+
+    ``?period=hour`` (the default) or ``minute``. Every bucket lists the
+    net change and the running total of each choice, in the order of
+    ``choices``. Only the rollups written by rollup_votes are read, so the
+    cost follows the number of buckets, not votes.
+    """
+    question = get_object_or_404(Question.objects.published(), pk=pk)
+    period = request.GET.get("period", VoteRollup.Period.HOUR)
+    if period not in VoteRollup.Period.values:
+        return error("period must be minute or hour.", 400)
+    choices = list(question.choice_set.order_by("id")
+                   .values("id", "choice_text"))
+    totals = {choice["id"]: 0 for choice in choices}
+    buckets = []
+    rollups = (VoteRollup.objects.filter(question=question, period=period)
+               .order_by("bucket").values_list("bucket", "choice_id",
+                                               "votes"))
+    for bucket, rows in groupby(rollups, key=lambda row: row[0]):
+        changes = {choice_id: votes for _, choice_id, votes in rows}
+        for choice_id, votes in changes.items():
+            totals[choice_id] += votes
+        buckets.append({"time": bucket,
+                        "votes": [changes.get(pk, 0) for pk in totals],
+                        "totals": list(totals.values())})
+    data = {"question": question.id, "period": period, "choices": choices,
+            "buckets": buckets}
+    return conditional_json(request, data)
+
+
+@require_POST
+def question_vote(request, pk):
+    """Vote with a JSON body ``{"choice": <id>}``.
+
+    Uses the session login and needs the CSRF token in X-CSRFToken.
+    """
+    if not request.user.is_authenticated:
+        return error("Authentication required.", 401)
+    question = get_object_or_404(Question, pk=pk)
+    if not question.can_vote():
+        return error("Voting is not allowed for this poll.", 403)
+    try:
+        choice_id = int(json.loads(request.body)["choice"])
+        choice = question.choice_set.get(pk=choice_id)
+    except (ValueError, KeyError, TypeError, OverflowError,
+            Choice.DoesNotExist):
+        return error("A valid choice is required.", 400)
+    previous = record_vote(request.user, choice)
+    return JsonResponse({"question": question.id, "choice": choice.id,
+                         "previous_choice": previous})
+
+
+def load_batch(items):
+    """Fetch the users, questions and choices of a batch in bulk.
+
+    Return ({user key: user id}, {question id: question},
+    {choice id: question id}).
+    """
+    users = resolve_users({user for user, _, _ in items})
+    questions = Question.objects.in_bulk({q for _, q, _ in items})
+    choices = dict(Choice.objects.filter(pk__in={c for _, _, c in items})
+                   .values_list("pk", "question_id"))
+    return users, questions, choices
+
+
+def check_vote(user_id, question, choice_question_id):
+    """Return why a vote of a batch cannot be counted, or None."""
+    if user_id is None:
+        return "Unknown user."
+    if question is None:
+        return "Unknown question."
+    if choice_question_id != question.id:
+        return "The choice does not belong to the question."
+    if not question.can_vote():
+        return "Voting is not allowed for this poll."
+    return None
+
+
+def apply_batch(items, accepted, results):
+    """Save the accepted votes and fill in their results.
+
+    Return {question id: ids of the choices whose tally changed}.
+    """
+    previous = Vote.objects.cast_many(
+        (user_id, items[index][2], question_id)
+        for (user_id, question_id), index in accepted.items())
+    changed = {}
+    for (user_id, question_id), index in accepted.items():
+        old, new = previous[user_id, question_id], items[index][2]
+        if old is None:
+            status = "created"
+        else:
+            status = "unchanged" if old == new else "updated"
+        results[index] = {"status": status, "previous_choice": old}
+        if old != new:
+            changed.setdefault(question_id, set()).update({old, new} - {None})
+    return changed
+
+
+@require_POST
+def batch_vote(request):
+    """Record many votes, e.g. collected offline by a kiosk.
+
+    The JSON body is ``{"votes": [{"user": <id or username>, "question":
+    <id>, "choice": <id>}, ...]}``; a number is a user id, a string a
+    username, or use ``user_id``/``username`` to be explicit. It needs a
+    login with the ``polls.add_vote`` permission. Every vote is checked against the same
+    rules as a single vote, the valid ones are saved together and the
+    response has one result per item, in order.
+    """
+    if not request.user.is_authenticated:
+        return error("Authentication required.", 401)
+    if not request.user.has_perm("polls.add_vote"):
+        return error("Permission denied.", 403)
+    try:
+        items = json.loads(request.body)["votes"]
+        if not isinstance(items, list) or not all(
+                isinstance(item, dict) for item in items):
+            raise TypeError("votes must be a list of objects")
+        items = [(user_key(item), int(item["question"]),
+                  int(item["choice"])) for item in items]
+    except (ValueError, KeyError, TypeError, OverflowError):
+        return error("Expected {\"votes\": [{\"user\", \"question\", "
+                     "\"choice\"}, ...]}.", 400)
+    if len(items) > settings.POLLS_VOTE_BATCH_LIMIT:
+        return error(f"At most {settings.POLLS_VOTE_BATCH_LIMIT} votes per "
+                     f"request.", 400)
+
+    users, questions, choices = load_batch(items)
+    results = []
+    accepted = {}
+    for index, (user, question_id, choice_id) in enumerate(items):
+        problem = check_vote(users.get(user), questions.get(question_id),
+                             choices.get(choice_id))
+        if problem:
+            results.append({"status": "error", "error": problem})
+            continue
+        key = (users[user], question_id)
+        if key in accepted:
+            # A later vote of the same user on the question wins.
+            results[accepted[key]] = {"status": "superseded"}
+        accepted[key] = index
+        results.append(None)
+
+    changed = apply_batch(items, accepted, results)
+    transaction.on_commit(lambda: [
+        broadcaster.publish(question_id, choice_ids)
+        for question_id, choice_ids in changed.items()])
+    event_logger.info("User %s submitted %d votes", request.user.username,
+                      len(accepted), extra={
+                          "event": "batch_vote", "user": request.user.id,
+                          "accepted": len(accepted), "total": len(items)})
+    return JsonResponse({"results": results})
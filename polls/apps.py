@@ -7,3 +7,12 @@ class PollsConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        """Connect the cache invalidation and vote buffer signals."""
+        from . import cache  # noqa: F401
+        from django.conf import settings
+        from django.core.signals import request_started
+        if settings.POLLS_VOTE_BUFFER:
+            from .buffer import start_flusher
+            request_started.connect(start_flusher)
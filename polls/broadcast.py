@@ -0,0 +1,79 @@
+"""In-process fan-out of live vote tallies to the results streams."""
+import asyncio
+import json
+import threading
+
+from .models import Choice
+
+
+class ResultsBroadcaster:
+    """Push tally changes of a question to the viewers in this process.
+
+    Each server process has its own broadcaster, so the streams also
+    re-read the tally now and then for votes cast elsewhere.
+    Subscribers are asyncio queues living on the server's event loop. The
+    vote view publishes from its own thread, so every put is handed to the
+    subscriber's loop. The tallies are read once per vote no matter how
+    many viewers are connected, and not at all when nobody is listening.
+    """
+
+    queue_size = 100
+
+    def __init__(self):
+        """Start without any subscribers."""
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, question_id):
+        """Return a new queue receiving {choice id: votes} of a question."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(question_id, set()).add(subscriber)
+        return queue
+
+    def unsubscribe(self, question_id, queue):
+        """Stop sending events of a question to the queue."""
+        with self._lock:
+            subscribers = self._subscribers.get(question_id, set())
+            subscribers.difference_update(
+                {item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(question_id, None)
+
+    def has_subscribers(self, question_id):
+        """Check whether anyone is watching a question."""
+        with self._lock:
+            return bool(self._subscribers.get(question_id))
+
+    def publish(self, question_id, choice_ids):
+        """Send the current counts of the changed choices to all viewers."""
+        if not self.has_subscribers(question_id):
+            return
+        counts = dict(Choice.objects.filter(pk__in=choice_ids)
+                      .values_list("pk", "vote_count"))
+        delta = {str(pk): votes for pk, votes in counts.items()}
+        with self._lock:
+            subscribers = list(self._subscribers.get(question_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, delta)
+            except RuntimeError:
+                # The viewer's event loop has already been closed.
+                self.unsubscribe(question_id, queue)
+
+
+def _offer(queue, delta):
+    """Queue a change, dropping it for a viewer that is too far behind."""
+    try:
+        queue.put_nowait(delta)
+    except asyncio.QueueFull:
+        pass
+
+
+def format_event(name, data):
+    """Format a Server-Sent Event."""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+broadcaster = ResultsBroadcaster()
@@ -0,0 +1,214 @@
+"""Optional write-behind buffer for votes.
+
+With POLLS_VOTE_BUFFER set to a file path, a vote is acknowledged once it
+is committed to a local SQLite journal (WAL mode, synchronous writes). A
+background thread in every server process moves the buffered votes into
+the main database in batches with Vote.objects.cast_many(). A user's
+newer vote for a question replaces the buffered one, and votes left in the
+journal by a crash are written out when the server starts again.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import IntegrityError, connection
+
+from .broadcast import broadcaster
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """A durable journal of votes waiting to be written to the database."""
+
+    def __init__(self, path, interval=0.5, batch_size=500):
+        """Open (or create) the journal at path."""
+        self.path = str(path)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                "user_id INTEGER NOT NULL, question_id INTEGER NOT NULL, "
+                "choice_id INTEGER NOT NULL, seq INTEGER NOT NULL, "
+                "PRIMARY KEY (user_id, question_id))")
+            db.execute("CREATE INDEX IF NOT EXISTS pending_question "
+                       "ON pending (question_id)")
+
+    def _connection(self):
+        """Return the journal connection of the current thread."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30,
+                                 isolation_level="IMMEDIATE")
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=FULL")
+            self._local.db = db
+        return db
+
+    def append(self, user_id, question_id, choice_id):
+        """Durably record a vote, replacing a buffered one of the user."""
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO pending VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id, question_id) DO UPDATE SET "
+                "choice_id = excluded.choice_id, seq = excluded.seq",
+                (user_id, question_id, choice_id, time.time_ns()))
+
+    def pending_choice(self, user_id, question_id):
+        """Return the buffered choice of a user for a question, or None."""
+        row = self._connection().execute(
+            "SELECT choice_id FROM pending WHERE user_id = ? "
+            "AND question_id = ?", (user_id, question_id)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        """Return the number of votes waiting in the journal."""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def flush(self, question_id=None):
+        """Write one batch of buffered votes to the database.
+
+        Only the votes for question_id are written when it is given.
+        Return the number of votes written or dropped. A vote replaced in
+        the journal while it was being written stays there for the next
+        batch, and so does the whole batch when the database fails.
+        """
+        if question_id is None:
+            rows = self._connection().execute(
+                "SELECT user_id, question_id, choice_id, seq FROM pending "
+                "ORDER BY seq LIMIT ?", (self.batch_size,)).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT user_id, question_id, choice_id, seq FROM pending "
+                "WHERE question_id = ? ORDER BY seq LIMIT ?",
+                (question_id, self.batch_size)).fetchall()
+        if not rows:
+            return 0
+        try:
+            previous = Vote.objects.cast_many(
+                (user_id, choice_id, question_id)
+                for user_id, question_id, choice_id, _ in rows)
+        except IntegrityError:
+            # A user or choice was deleted meanwhile; write the votes one
+            # by one and drop the ones that cannot be saved.
+            return self._flush_one_by_one(rows)
+        self._remove(rows, previous)
+        return len(rows)
+
+    def _flush_one_by_one(self, rows):
+        """Write votes separately, dropping the ones that cannot be saved.
+
+        Any other database error stops the batch; the votes handled so far
+        are removed from the journal and the rest stay for the next pass.
+        """
+        previous, done = {}, []
+        try:
+            for row in rows:
+                user_id, question_id, choice_id, _ = row
+                try:
+                    previous.update(Vote.objects.cast_many(
+                        [(user_id, choice_id, question_id)]))
+                except IntegrityError:
+                    logger.exception("Dropped buffered vote of user %s for "
+                                     "choice %s", user_id, choice_id)
+                done.append(row)
+        finally:
+            self._remove(done, previous)
+        return len(done)
+
+    def _remove(self, rows, previous):
+        """Announce the written votes and delete the rows from the journal."""
+        changed = {}
+        for user_id, question_id, choice_id, _ in rows:
+            old = previous.get((user_id, question_id), choice_id)
+            if old != choice_id:
+                changed.setdefault(question_id, set()).update(
+                    {old, choice_id} - {None})
+        for question_id, choice_ids in changed.items():
+            broadcaster.publish(question_id, choice_ids)
+        with self._connection() as db:
+            db.executemany(
+                "DELETE FROM pending WHERE user_id = ? AND question_id = ? "
+                "AND seq = ?",
+                [(user_id, question_id, seq)
+                 for user_id, question_id, _, seq in rows])
+
+    def start(self):
+        """Start the background flusher thread if it is not running."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="vote-buffer-flusher")
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread after its current batch."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        """Flush batches until stopped, pausing when the journal is empty."""
+        while not self._stop.is_set():
+            try:
+                written = self.flush()
+            except Exception:
+                logger.exception("Could not flush the vote buffer")
+                written = 0
+            finally:
+                # Hand the database connection back between batches.
+                connection.close()
+            if written < self.batch_size:
+                self._stop.wait(self.interval)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    """Return the vote buffer of this process, or None when it is off."""
+    global _buffer
+    path = settings.POLLS_VOTE_BUFFER
+    if not path:
+        return None
+    with _buffer_lock:
+        if _buffer is None or _buffer.path != str(path):
+            _buffer = VoteBuffer(path,
+                                 interval=settings.POLLS_VOTE_BUFFER_INTERVAL,
+                                 batch_size=settings.POLLS_VOTE_BUFFER_BATCH)
+    return _buffer
+
+
+def flush_question(question_id):
+    """Write every buffered vote for a question, e.g. before it freezes.
+
+    Only the journal of this host is flushed.
+    """
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        while vote_buffer.flush(question_id):
+            pass
+
+
+def start_flusher(**kwargs):
+    """Start flushing when a server process handles its first request.
+
+    This also writes out the votes a crashed process left behind.
+    """
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        vote_buffer.start()
+    request_started.disconnect(start_flusher)
@@ -0,0 +1,72 @@
+"""Caches of the index page questions and the closed poll results."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Question, ResultSnapshot
+from .pagination import keyset_page
+
+INDEX_CACHE_KEY = "polls:index"
+SNAPSHOT_CACHE_KEY = "polls:snapshot:{}"
+
+
+def get_index_page():
+    """Return the first page of published questions, cached if possible.
+
+    The entry expires when the next scheduled question is due, so a new
+    poll shows up soon after update_poll_status opens it.
+    """
+    page = cache.get(INDEX_CACHE_KEY)
+    if page is not None:
+        return page
+    now = timezone.now()
+    page = keyset_page(Question.objects.published(),
+                       settings.POLLS_INDEX_PAGE_SIZE)
+    timeout = settings.POLLS_INDEX_CACHE_TIMEOUT
+    next_pub_date = (Question.objects.filter(pub_date__gt=now)
+                     .order_by("pub_date")
+                     .values_list("pub_date", flat=True).first())
+    if next_pub_date is not None:
+        timeout = min(timeout, (next_pub_date - now).total_seconds())
+    if timeout > 0:
+        cache.set(INDEX_CACHE_KEY, page, timeout)
+    return page
+
+
+def get_cached_snapshot(question_id):
+    """Return the cached result snapshot of a closed question, or None."""
+    return cache.get(SNAPSHOT_CACHE_KEY.format(question_id))
+
+
+def cache_snapshot(snapshot):
+    """Keep a result snapshot, with its question, in the cache for a while.
+
+    The entry expires after POLLS_SNAPSHOT_CACHE_TIMEOUT, so a poll that
+    was reopened in another process does not stay frozen here.
+    """
+    timeout = settings.POLLS_SNAPSHOT_CACHE_TIMEOUT
+    if timeout > 0:
+        cache.set(SNAPSHOT_CACHE_KEY.format(snapshot.question_id), snapshot,
+                  timeout)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_index(sender, **kwargs):
+    """Drop the cached index whenever a question changes."""
+    cache.delete(INDEX_CACHE_KEY)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_snapshot(sender, instance, **kwargs):
+    """Drop the result snapshot of a question that changed.
+
+    A question reopened by a new end_date also loses its snapshot row.
+    """
+    cache.delete(SNAPSHOT_CACHE_KEY.format(instance.pk))
+    if kwargs.get("created") is False and \
+            instance.status != Question.Status.CLOSED:
+        ResultSnapshot.objects.filter(question=instance).delete()
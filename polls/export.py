@@ -0,0 +1,88 @@
+"""Streaming exports of poll results and raw votes.
+
+Rows are read with QuerySet.iterator(), which uses a server-side cursor on
+PostgreSQL, and written out a chunk at a time, so an export needs the same
+memory for a thousand votes as for millions.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Choice, Vote
+
+CHUNK_SIZE = 2000
+
+# {name: (columns, function returning the rows as tuples)}
+EXPORTS = {
+    "results": (
+        ("question", "question_text", "choice", "choice_text", "votes"),
+        lambda: Choice.objects.order_by("question_id", "id").values_list(
+            "question_id", "question__question_text", "id", "choice_text",
+            "vote_count"),
+    ),
+    "votes": (
+        ("id", "question", "choice", "user", "created_at", "updated_at"),
+        lambda: Vote.objects.order_by("id").values_list(
+            "id", "question_id", "choice_id", "user__username",
+            "created_at", "updated_at"),
+    ),
+}
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "columns": ("application/x-ndjson", "jsonl"),
+}
+
+
+class Echo:
+    """File-like object that returns what is written to it."""
+
+    def write(self, value):
+        """Return the value instead of storing it."""
+        return value
+
+
+def csv_lines(columns, rows):
+    """Yield a CSV header and one line per row."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def column_lines(columns, rows, chunk_size=CHUNK_SIZE):
+    """Yield one JSON line per chunk of rows, with a list per column.
+
+    Each column name is written once per chunk instead of once per row,
+    and a reader can load a single column without parsing the others.
+    """
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        yield json.dumps(dict(zip(columns, zip(*chunk))),
+                         cls=DjangoJSONEncoder) + "\n"
+
+
+def export_lines(name, output_format, chunk_size=CHUNK_SIZE):
+    """Yield the lines of an export in the given format."""
+    columns, queryset = EXPORTS[name]
+    rows = queryset().iterator(chunk_size=chunk_size)
+    if output_format == "csv":
+        return csv_lines(columns, rows)
+    return column_lines(columns, rows, chunk_size)
+
+
+async def aexport_lines(name, output_format, chunk_size=CHUNK_SIZE):
+    """Yield the lines of an export to an ASGI response.
+
+    Django would read a plain generator into a list before sending it
+    over ASGI, so the lines are taken from the database thread a chunk
+    at a time instead.
+    """
+    lines = export_lines(name, output_format, chunk_size)
+    take = sync_to_async(lambda: list(islice(lines, chunk_size)))
+    while chunk := await take():
+        for line in chunk:
+            yield line
@@ -0,0 +1,26 @@
+"""Password hashers whose cost is set from the settings."""
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, \
+    ScryptPasswordHasher
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with the ARGON2_* costs of the settings.
+
+    Hashes made with other costs are upgraded at the next login.
+    """
+
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """Scrypt with the SCRYPT_* costs of the settings.
+
+    Hashes made with other costs are upgraded at the next login.
+    """
+
+    work_factor = settings.SCRYPT_WORK_FACTOR
+    block_size = settings.SCRYPT_BLOCK_SIZE
+    parallelism = settings.SCRYPT_PARALLELISM
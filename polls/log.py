@@ -0,0 +1,54 @@
+"""Non-blocking logging handler and JSON formatter for the polls logs."""
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message"}
+
+
+class QueueListenerHandler(QueueHandler):
+    """Put records on a queue and write them from a background thread.
+
+    ``handlers`` are the handlers doing the actual I/O. In LOGGING refer
+    to them as ``"cfg://handlers.<name>"``; they must be named so that
+    they sort before this handler, which dictConfig configures in order.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        """Start a listener thread that feeds the given handlers."""
+        super().__init__(queue.SimpleQueue())
+        handlers = [handlers[index] for index in range(len(handlers))]
+        self.listener = QueueListener(
+            self.queue, *handlers,
+            respect_handler_level=respect_handler_level)
+        self.listener.start()
+
+    def close(self):
+        """Write out the queued records and stop the listener thread.
+
+        logging.shutdown() calls this at exit, before the file handlers
+        (created earlier) are closed.
+        """
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record, including its ``extra`` fields, as one JSON line."""
+
+    def format(self, record):
+        """Return the record as a JSON object."""
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update({key: value for key, value in vars(record).items()
+                     if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
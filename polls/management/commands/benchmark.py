@@ -0,0 +1,201 @@
+"""Load-test the index, detail, results and vote pages of a running server."""
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, \
+    Request, build_opener
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls.models import Choice, Question
+from polls.seed import seed_synthetic
+
+USER_PREFIX = "bench-user-"
+PASSWORD = "bench-password"
+ENDPOINTS = ("index", "detail", "results", "vote")
+
+
+class Command(BaseCommand):
+    """Seed benchmark data and report latency, throughput and queries."""
+
+    help = "Seed benchmark polls and drive the polls pages of a running " \
+           "server concurrently, reporting p50/p95/p99 latency, requests " \
+           "per second and queries per request."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("--url", default="http://127.0.0.1:8000",
+                            help="Base URL of the running server.")
+        parser.add_argument("--seed", action="store_true",
+                            help="Create the benchmark polls and users first.")
+        parser.add_argument("--questions", type=int, default=20)
+        parser.add_argument("--choices", type=int, default=5)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--votes", type=int, default=1000,
+                            help="Number of votes to seed.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests sent to each endpoint.")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--random-seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        """Seed if asked, count queries in-process, then load the server."""
+        self.random = random.Random(options["random_seed"])
+        if options["seed"]:
+            self.seed(options["questions"], options["choices"],
+                      options["users"], options["votes"])
+        questions = list(Question.objects.filter(
+            question_text__endswith="[bench]").values_list("id", flat=True))
+        users = list(User.objects.filter(
+            username__startswith=USER_PREFIX).order_by("id"))
+        if not questions or not users:
+            raise CommandError("No benchmark data, run with --seed first.")
+        choices = {}
+        for choice_id, question_id in Choice.objects.filter(
+                question_id__in=questions).values_list("id", "question_id"):
+            choices.setdefault(question_id, []).append(choice_id)
+
+        queries = self.count_queries(questions[0], choices[questions[0]][0],
+                                     users[0])
+        self.stdout.write(
+            f"{'endpoint':<10}{'requests':>10}{'req/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'queries':>9}")
+        for endpoint in ENDPOINTS:
+            latencies, errors, elapsed = self.load(
+                options["url"].rstrip("/"), endpoint, questions, choices,
+                users[:options["concurrency"]], options["requests"],
+                options["concurrency"])
+            self.report(endpoint, latencies, errors, elapsed,
+                        queries[endpoint])
+
+    def seed(self, questions, choices, users, votes):
+        """Create polls modelled on the fixture, users and random votes."""
+        new_questions, new_choices, new_users, votes = seed_synthetic(
+            self.random, questions, choices, users, votes,
+            user_prefix=USER_PREFIX, password=PASSWORD, suffix=" [bench]")
+        self.stdout.write(
+            f"Seeded {len(new_questions)} questions, {len(new_choices)} "
+            f"choices, {len(new_users)} users and {votes} votes.")
+
+    def count_queries(self, question_id, choice_id, user):
+        """Render every endpoint once in-process and count its queries."""
+        client = Client(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        client.force_login(user)
+        counts = {}
+        for endpoint in ENDPOINTS:
+            method, path, data = request_for(endpoint, question_id,
+                                             choice_id)
+            with CaptureQueriesContext(connection) as context:
+                getattr(client, method.lower())(path, data)
+            counts[endpoint] = len(context.captured_queries)
+        return counts
+
+    def load(self, base_url, endpoint, questions, choices, users, requests,
+             concurrency):
+        """Send the requests from concurrent logged-in sessions."""
+        sessions = [Session(base_url, user.username) for user in users]
+        local = threading.local()
+        lock = threading.Lock()
+
+        def work(number):
+            if not hasattr(local, "session"):
+                with lock:
+                    local.session = sessions.pop()
+            question_id = questions[number % len(questions)]
+            choice_id = self.random.choice(choices[question_id])
+            method, path, data = request_for(endpoint, question_id,
+                                             choice_id)
+            started = time.perf_counter()
+            ok = local.session.send(method, path, data)
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(concurrency,
+                                                len(sessions))) as pool:
+            results = list(pool.map(work, range(requests)))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, ok in results if not ok)
+        return latencies, errors, elapsed
+
+    def report(self, endpoint, latencies, errors, elapsed, queries):
+        """Write one line of the result table."""
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0
+        self.stdout.write(
+            f"{endpoint:<10}{len(latencies):>10}"
+            f"{len(latencies) / elapsed:>10.1f}{p50 * 1000:>10.1f}"
+            f"{p95 * 1000:>10.1f}{p99 * 1000:>10.1f}{errors:>8}"
+            f"{queries:>9}")
+
+
+def request_for(endpoint, question_id, choice_id):
+    """Return (method, path, data) of a request to an endpoint."""
+    if endpoint == "index":
+        return "GET", reverse("polls:index"), None
+    if endpoint == "vote":
+        return ("POST", reverse("polls:vote", args=(question_id,)),
+                {"choice": choice_id})
+    return "GET", reverse(f"polls:{endpoint}", args=(question_id,)), None
+
+
+class Session:
+    """A logged-in HTTP session against the server under test."""
+
+    def __init__(self, base_url, username):
+        """Log in as the user and keep the cookies."""
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies),
+                                   NoRedirect())
+        self.send("GET", reverse("login"))
+        if not self.send("POST", reverse("login"),
+                         {"username": username, "password": PASSWORD}):
+            raise CommandError(f"Could not log in as {username}.")
+
+    def csrf_token(self):
+        """Return the CSRF cookie value."""
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ""
+
+    def send(self, method, path, data=None):
+        """Send a request and return whether it worked."""
+        body = None
+        if method == "POST":
+            data = dict(data or {}, csrfmiddlewaretoken=self.csrf_token())
+            body = urlencode(data).encode()
+        request = Request(self.base_url + path, data=body, method=method,
+                          headers={"Referer": self.base_url + path})
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status < 400
+        except HTTPError as error:
+            # Redirects are not followed, so a vote is timed on its own.
+            return error.code < 400
+        except OSError:
+            return False
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """Report redirects as responses instead of following them."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        """Do not follow the redirect."""
+        return None
@@ -0,0 +1,65 @@
+"""Measure login requests per second on one core for each hasher profile."""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+USERNAME = "bench-login"
+PASSWORD = "bench-login-password"
+
+
+class Command(BaseCommand):
+    """Time in-process logins under every PASSWORD_HASHER_PROFILES entry."""
+
+    help = "Log a user in REQUESTS times under each password hasher " \
+           "profile, in one thread, and report logins per second per " \
+           "core. The test user is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("--requests", type=int, default=20,
+                            help="Logins per profile.")
+        parser.add_argument("--profiles", nargs="*",
+                            choices=sorted(settings.PASSWORD_HASHER_PROFILES),
+                            help="Profiles to measure, all by default.")
+
+    def handle(self, *args, **options):
+        """Print one line per profile."""
+        self.stdout.write(f"{'profile':<10}{'logins':>8}{'per s/core':>12}"
+                          f"{'ms each':>10}")
+        profiles = options["profiles"] or settings.PASSWORD_HASHER_PROFILES
+        for profile in profiles:
+            try:
+                elapsed = self.measure(profile, options["requests"])
+            except ValueError as error:
+                # e.g. argon2 without the argon2-cffi package
+                self.stdout.write(f"{profile:<10}  skipped: {error}")
+                continue
+            self.stdout.write(
+                f"{profile:<10}{options['requests']:>8}"
+                f"{options['requests'] / elapsed:>12.1f}"
+                f"{elapsed / options['requests'] * 1000:>10.1f}")
+
+    def measure(self, profile, requests):
+        """Return the seconds taken by the logins under a profile."""
+        hashers = settings.PASSWORD_HASHER_PROFILES[profile]
+        with override_settings(PASSWORD_HASHERS=hashers), \
+                transaction.atomic():
+            User.objects.create_user(username=USERNAME, password=PASSWORD)
+            client = Client(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+            url = reverse("login")
+            start = time.perf_counter()
+            for _ in range(requests):
+                response = client.post(url, {"username": USERNAME,
+                                             "password": PASSWORD})
+                if response.status_code != 302:
+                    raise ValueError("login failed")
+                client.logout()
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed
@@ -0,0 +1,35 @@
+"""Stream poll results or raw votes to a file or stdout."""
+from django.core.management.base import BaseCommand
+
+from polls.export import CHUNK_SIZE, EXPORTS, FORMATS, export_lines
+
+
+class Command(BaseCommand):
+    """Export results or votes as CSV or column chunks."""
+
+    help = "Write the results of every poll, or every vote, as CSV or as " \
+           "JSON lines with one list per column and chunk. Rows are " \
+           "streamed, so memory use does not grow with the table."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("name", choices=sorted(EXPORTS),
+                            help="What to export.")
+        parser.add_argument("--format", choices=sorted(FORMATS),
+                            default="csv", help="Output format.")
+        parser.add_argument("--output", help="File to write instead of "
+                                             "stdout.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                            help="Rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        """Write the export."""
+        lines = export_lines(options["name"], options["format"],
+                             options["chunk_size"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", newline="",
+                  encoding="utf-8") as output:
+            output.writelines(lines)
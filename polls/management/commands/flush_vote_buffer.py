@@ -0,0 +1,22 @@
+"""Write the votes waiting in the write-behind buffer to the database."""
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.buffer import get_vote_buffer
+
+
+class Command(BaseCommand):
+    """Empty the vote buffer journal into the database."""
+
+    help = "Write every vote waiting in the POLLS_VOTE_BUFFER journal to " \
+           "the database, e.g. before a deploy or after a crash."
+
+    def handle(self, *args, **options):
+        """Flush batches until the journal is empty."""
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is None:
+            raise CommandError("POLLS_VOTE_BUFFER is not set.")
+        total = 0
+        while written := vote_buffer.flush():
+            total += written
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {total} buffered vote(s)."))
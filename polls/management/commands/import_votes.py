@@ -0,0 +1,219 @@
+"""Stream votes from a JSON Lines, CSV or fixture file into the database."""
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import Choice, Vote
+from polls.voters import resolve_users, user_key
+
+# Resolved lookups are kept up to this many entries per cache.
+CACHE_LIMIT = 100_000
+FORMATS = {"jsonl": "jsonl", "csv": "csv", "json": "fixture"}
+
+
+class JsonArrayReader:
+    """Iterate over the items of a top-level JSON array in a text stream.
+
+    Only the text of the item being decoded is kept in memory. Raise
+    ValueError when the stream is not a JSON array.
+    """
+
+    def __init__(self, stream, chunk_size=65536):
+        """Read the stream chunk_size characters at a time."""
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.done = False
+
+    def read(self):
+        """Append the next chunk of the stream to the buffer."""
+        chunk = self.stream.read(self.chunk_size)
+        self.done = not chunk
+        self.buffer += chunk
+
+    def peek(self):
+        """Return the next non-blank character, or "" at the end."""
+        while not self.buffer.strip() and not self.done:
+            self.read()
+        self.buffer = self.buffer.lstrip()
+        return self.buffer[:1]
+
+    def take(self):
+        """Remove and return the next non-blank character."""
+        char = self.peek()
+        self.buffer = self.buffer[1:]
+        return char
+
+    def decode(self):
+        """Remove and return the next JSON value of the buffer."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer)
+            except json.JSONDecodeError:
+                if self.done:
+                    raise
+                self.read()
+                continue
+            # A number at the end of the buffer may go on in the next chunk.
+            if self.done or self.buffer[end:].strip():
+                self.buffer = self.buffer[end:]
+                return value
+            self.read()
+
+    def __iter__(self):
+        """Yield the items of the array."""
+        if self.take() != "[":
+            raise ValueError("Expected a JSON array.")
+        if self.peek() == "]":
+            return
+        while True:
+            yield self.decode()
+            separator = self.take()
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError("Expected ',' or ']' in the JSON array.")
+
+
+class Command(BaseCommand):
+    """Import votes in batches without loading the whole file."""
+
+    help = "Import votes from a JSON Lines, CSV or fixture (.json) file. " \
+           "Each record has a 'choice' id and a 'user_id' or 'username'. " \
+           "A plain 'user' is an id when it is a JSON number and a " \
+           "username otherwise. Fixture files hold polls.vote objects, " \
+           "like data/votes-v4.json."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("path", help="File to import.")
+        parser.add_argument(
+            "--format", choices=sorted(set(FORMATS.values())),
+            help="File format, taken from the extension by default.")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of votes written per INSERT.")
+
+    def handle(self, *args, **options):
+        """Read, resolve and write the votes batch by batch."""
+        path = Path(options["path"])
+        suffix = path.suffix.lstrip(".").lower()
+        file_format = options["format"] or FORMATS.get(suffix)
+        if file_format is None:
+            raise CommandError(f"Unknown vote file format: {suffix}")
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        self.users = {}
+        self.choices = {}
+        self.questions = set()
+        imported = skipped = 0
+        started = time.monotonic()
+        with path.open(newline="", encoding="utf-8") as stream:
+            batch = []
+            for record in self.read_records(stream, file_format):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    written, missing = self.write_batch(batch)
+                    imported += written
+                    skipped += missing
+                    batch = []
+                    self.report(imported, skipped, started)
+            if batch:
+                written, missing = self.write_batch(batch)
+                imported += written
+                skipped += missing
+        self.recount()
+        self.report(imported, skipped, started)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} vote(s), skipped {skipped}."))
+
+    def read_records(self, stream, file_format):
+        """Yield (user, choice) pairs from the stream one at a time."""
+        if file_format == "csv":
+            rows = csv.DictReader(stream)
+        elif file_format == "fixture":
+            rows = self.fixture_rows(stream)
+        else:
+            rows = (line for line in stream if line.strip())
+        for number, row in enumerate(rows, start=1):
+            try:
+                if file_format == "jsonl":
+                    row = json.loads(row)
+                elif file_format == "fixture":
+                    if row.get("model") != "polls.vote":
+                        raise ValueError("Not a polls.vote object.")
+                    row = row["fields"]
+                yield user_key(row), int(row["choice"])
+            except (AttributeError, KeyError, OverflowError, TypeError,
+                    ValueError) as exc:
+                raise CommandError(
+                    f"Invalid vote record {number}: {row!r} ({exc})")
+
+    def fixture_rows(self, stream):
+        """Yield the objects of a fixture file, failing with CommandError."""
+        try:
+            yield from JsonArrayReader(stream)
+        except ValueError as exc:
+            raise CommandError(f"Invalid fixture file: {exc}")
+
+    def resolve(self, batch):
+        """Fill the user and choice caches for the keys of this batch."""
+        for cache in (self.users, self.choices):
+            if len(cache) > CACHE_LIMIT:
+                cache.clear()
+        self.users.update(resolve_users(
+            {user for user, _ in batch if user not in self.users}))
+        choices = {choice for _, choice in batch
+                   if choice not in self.choices}
+        self.choices.update(Choice.objects.filter(pk__in=choices)
+                            .values_list("pk", "question_id"))
+
+    def write_batch(self, batch):
+        """Upsert one batch of votes and return (written, skipped)."""
+        self.resolve(batch)
+        votes = {}
+        missing = 0
+        for user, choice in batch:
+            user_id = self.users.get(user)
+            question_id = self.choices.get(choice)
+            if user_id is None or question_id is None:
+                missing += 1
+                continue
+            # The last vote of a user for a question wins.
+            votes[user_id, question_id] = Vote(
+                user_id=user_id, question_id=question_id, choice_id=choice)
+        with transaction.atomic():
+            Vote.objects.bulk_create(
+                votes.values(),
+                update_conflicts=True,
+                unique_fields=["user", "question"],
+                update_fields=["choice", "updated_at"],
+            )
+        self.questions.update(question for _, question in votes)
+        return len(batch) - missing, missing
+
+    def recount(self):
+        """Recount the vote counters of every question that was touched."""
+        choices = (Choice.objects.filter(question_id__in=self.questions)
+                   .annotate(total=Count("vote")).only("id", "vote_count"))
+        stale = [choice for choice in choices
+                 if choice.vote_count != choice.total]
+        for choice in stale:
+            choice.vote_count = choice.total
+        Choice.objects.bulk_update(stale, ["vote_count"], batch_size=500)
+
+    def report(self, imported, skipped, started):
+        """Write the progress and throughput so far."""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f"{imported} imported, {skipped} skipped, "
+            f"{imported / elapsed:.0f} votes/s")
@@ -0,0 +1,49 @@
+"""Delete expired sessions in small batches."""
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """Remove the expired rows of django_session."""
+
+    help = "Delete expired sessions a batch at a time, so the table is " \
+           "never locked for long. Only the db and cached_db session " \
+           "modes keep rows; the cache expires its own entries. Run it " \
+           "from cron, or keep it running with --interval."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Sessions deleted per statement.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and purge every INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        """Purge expired sessions once, or every interval seconds."""
+        if settings.SESSION_MODE not in ("db", "cached_db"):
+            self.stdout.write(f"SESSION_MODE is {settings.SESSION_MODE}; "
+                              f"no session rows to delete.")
+            return
+        while True:
+            deleted = self.purge(options["batch_size"])
+            self.stdout.write(f"Deleted {deleted} expired session(s).")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    def purge(self, batch_size):
+        """Delete the sessions that expired before now; return how many."""
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now)
+                        .values_list("session_key", flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            deleted += Session.objects.filter(session_key__in=keys,
+                                              expire_date__lt=now).delete()[0]
@@ -0,0 +1,44 @@
+"""Rebuild or verify the per-choice vote counters from the Vote rows."""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import Choice
+
+
+class Command(BaseCommand):
+    """Recount Choice.vote_count from the Vote table."""
+
+    help = "Rebuild Choice.vote_count from Vote rows, or verify it with " \
+           "--check."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report choices whose counter is out of date.")
+
+    def handle(self, *args, **options):
+        """Compare every counter with a fresh count and fix the drift."""
+        with transaction.atomic():
+            choices = (Choice.objects.annotate(total=Count("vote"))
+                       .only("id", "vote_count"))
+            stale = [choice for choice in choices
+                     if choice.vote_count != choice.total]
+            if options["check"]:
+                for choice in stale:
+                    self.stdout.write(
+                        f"Choice {choice.id}: counter {choice.vote_count}, "
+                        f"actual {choice.total}")
+                if stale:
+                    raise CommandError(
+                        f"{len(stale)} vote counter(s) are out of date.")
+                self.stdout.write(self.style.SUCCESS(
+                    "All vote counters are up to date."))
+                return
+            for choice in stale:
+                choice.vote_count = choice.total
+            Choice.objects.bulk_update(stale, ["vote_count"],
+                                       batch_size=500)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(stale)} vote counter(s)."))
@@ -0,0 +1,41 @@
+"""Show the per-URL query and timing counters of the metrics middleware."""
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from polls import metrics
+
+
+class Command(BaseCommand):
+    """Print the averages recorded by RequestMetricsMiddleware."""
+
+    help = "Show queries and time per request for each URL name. The " \
+           "counters live in the cache, so this needs a shared cache " \
+           "backend; with the local memory cache each server process has " \
+           "its own, shown to staff as JSON by the request-metrics page."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("--reset", action="store_true",
+                            help="Clear the counters after showing them.")
+
+    def handle(self, *args, **options):
+        """Print one line per URL name."""
+        if not metrics.is_shared():
+            raise CommandError(
+                "The counters are in the local memory cache of each server "
+                "process. Open "
+                f"{reverse('polls:request-metrics')} on the server as "
+                "staff, or set CACHE_BACKEND to a shared cache.")
+        self.stdout.write(
+            f"{'url name':<24}{'requests':>10}{'queries':>10}"
+            f"{'db ms':>10}{'view ms':>10}{'tpl ms':>10}")
+        for name, totals in metrics.snapshot().items():
+            count = max(totals["requests"], 1)
+            self.stdout.write(
+                f"{name:<24}{totals['requests']:>10}"
+                f"{totals['queries'] / count:>10.1f}"
+                f"{totals['db_us'] / count / 1000:>10.2f}"
+                f"{totals['view_us'] / count / 1000:>10.2f}"
+                f"{totals['template_us'] / count / 1000:>10.2f}")
+        if options["reset"]:
+            metrics.reset()
@@ -0,0 +1,104 @@
+"""Add the votes cast or changed since the last run to VoteRollup."""
+import datetime
+import time
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.core.management.base import BaseCommand
+
+from polls.models import Vote, VoteRollup
+
+PERIODS = {
+    VoteRollup.Period.MINUTE: {"second": 0, "microsecond": 0},
+    VoteRollup.Period.HOUR: {"minute": 0, "second": 0, "microsecond": 0},
+}
+
+
+class Command(BaseCommand):
+    """Update the per-minute and per-hour vote rollups incrementally."""
+
+    help = "Roll up the votes whose updated_at is past the newest minute " \
+           "bucket, less --overlap seconds for late commits. Votes already " \
+           "counted for their choice are skipped, so overlapping runs " \
+           "never count a vote twice. Run it from cron, or keep it " \
+           "running with --interval."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Votes rolled up per transaction.")
+        parser.add_argument(
+            "--overlap", type=int, default=300,
+            help="Seconds before the high-water mark to look at again.")
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and roll up every INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        """Roll up the new votes once, or every interval seconds."""
+        while True:
+            total = 0
+            while rolled := self.rollup(options["batch_size"],
+                                        options["overlap"]):
+                total += rolled
+            self.stdout.write(f"Rolled up {total} vote(s).")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    def rollup(self, batch_size, overlap):
+        """Roll up one batch of votes and return how many there were."""
+        mark = VoteRollup.objects.filter(
+            period=VoteRollup.Period.MINUTE).aggregate(
+            mark=Max("bucket"))["mark"]
+        pending = Vote.objects.exclude(rollup_choice=F("choice"))
+        if mark is not None:
+            pending = pending.filter(
+                updated_at__gte=mark - datetime.timedelta(seconds=overlap))
+        with transaction.atomic():
+            # Locked, so a vote changed meanwhile waits for the next batch.
+            votes = list(pending.select_for_update()
+                         .order_by("updated_at", "id")
+                         .values_list("id", "question_id", "choice_id",
+                                      "rollup_choice_id", "updated_at")
+                         [:batch_size])
+            if not votes:
+                return 0
+            self.add_deltas(self.deltas(votes))
+            Vote.objects.filter(pk__in=[vote[0] for vote in votes]).update(
+                rollup_choice=F("choice"))
+        return len(votes)
+
+    def deltas(self, votes):
+        """Return {(question, choice, period, bucket): change} of votes."""
+        deltas = {}
+        for _, question_id, choice_id, old_choice_id, updated_at in votes:
+            for period, truncate in PERIODS.items():
+                bucket = updated_at.replace(**truncate)
+                key = (question_id, choice_id, period, bucket)
+                deltas[key] = deltas.get(key, 0) + 1
+                if old_choice_id is not None:
+                    key = (question_id, old_choice_id, period, bucket)
+                    deltas[key] = deltas.get(key, 0) - 1
+        return deltas
+
+    def add_deltas(self, deltas):
+        """Add the changes to the rollup rows, creating missing ones."""
+        current = {
+            (question_id, choice_id, period, bucket): votes
+            for question_id, choice_id, period, bucket, votes in
+            VoteRollup.objects.select_for_update().filter(
+                choice_id__in={key[1] for key in deltas},
+                bucket__in={key[3] for key in deltas}).values_list(
+                "question_id", "choice_id", "period", "bucket", "votes")}
+        rows = []
+        for key, delta in deltas.items():
+            question_id, choice_id, period, bucket = key
+            rows.append(VoteRollup(question_id=question_id,
+                                   choice_id=choice_id, period=period,
+                                   bucket=bucket,
+                                   votes=current.get(key, 0) + delta))
+        VoteRollup.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=["choice", "period", "bucket"],
+            update_fields=["votes"])
@@ -0,0 +1,38 @@
+"""Move questions between scheduled, open and closed as their dates pass."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.cache import cache_snapshot, invalidate_index
+from polls.models import Question
+
+
+class Command(BaseCommand):
+    """Update Question.status from pub_date and end_date."""
+
+    help = "Update the status of every question whose pub_date or " \
+           "end_date has passed and freeze the results of closed ones. " \
+           "Run it from cron, or keep it running with --interval."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--interval", type=int, default=0,
+            help="Keep running and update every INTERVAL seconds.")
+
+    def handle(self, *args, **options):
+        """Update the statuses once, or every interval seconds."""
+        while True:
+            changed = Question.objects.refresh_status()
+            if changed:
+                # Bulk updates send no signals, so drop the index here.
+                invalidate_index(Question)
+            # Freeze the results of the questions that have just closed.
+            closed = Question.objects.filter(
+                status=Question.Status.CLOSED, snapshot__isnull=True)
+            for question in closed:
+                cache_snapshot(question.frozen_results())
+            self.stdout.write(f"{changed} question(s) changed status.")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,52 @@
+"""Per-URL request counters kept in the cache."""
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+METRICS_PREFIX = "polls:metrics:"
+NAMES_KEY = METRICS_PREFIX + "names"
+FIELDS = ("requests", "queries", "db_us", "view_us", "template_us")
+
+
+def _key(name):
+    """Return the cache key of the counters of a URL name."""
+    return f"{METRICS_PREFIX}url:{name}"
+
+
+def is_shared():
+    """Return whether the counters are shared by the server processes."""
+    return not isinstance(caches["default"], (DummyCache, LocMemCache))
+
+
+def record(name, **values):
+    """Add the values of one request to the counters of a URL name.
+
+    The counters of a URL name are one cache entry, read and written back
+    in two round trips. Two processes finishing a request at the same
+    moment may overwrite each other's numbers, which the averages can
+    live with.
+    """
+    values["requests"] = 1
+    totals = cache.get(_key(name))
+    if totals is None:
+        # A new, reset or evicted entry: make sure the name is listed.
+        names = cache.get(NAMES_KEY, set())
+        if name not in names:
+            cache.set(NAMES_KEY, names | {name}, None)
+        totals = {}
+    cache.set(_key(name), {field: totals.get(field, 0) + values.get(field, 0)
+                           for field in FIELDS}, None)
+
+
+def snapshot():
+    """Return {url name: {field: total}} for every recorded URL name."""
+    names = sorted(cache.get(NAMES_KEY, set()))
+    values = cache.get_many([_key(name) for name in names])
+    return {name: values[_key(name)] for name in names
+            if _key(name) in values}
+
+
+def reset():
+    """Forget all counters."""
+    names = cache.get(NAMES_KEY, set())
+    cache.delete_many([_key(name) for name in names] + [NAMES_KEY])
@@ -0,0 +1,65 @@
+"""Middleware that measures the queries and time spent on each request."""
+import time
+
+from django.db import connection
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """Count queries and time the database, view and template rendering.
+
+    The numbers are sent back in a ``Server-Timing`` header and added to
+    the per-URL-name counters in :mod:`polls.metrics`. Only
+    TemplateResponse rendering (the generic views) is timed as template
+    time; views calling ``render()`` count it as view time.
+    """
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Time the request and record its metrics."""
+        timing = {"queries": 0, "db": 0.0, "template": 0.0}
+
+        def execute_wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                timing["queries"] += 1
+                timing["db"] += time.perf_counter() - started
+
+        request.polls_timing = timing
+        started = time.perf_counter()
+        with connection.execute_wrapper(execute_wrapper):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        view = total - timing["template"]
+
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={timing["db"] * 1000:.1f};desc="{timing["queries"]} '
+            f'queries"',
+            f'view;dur={view * 1000:.1f}',
+            f'tpl;dur={timing["template"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        match = request.resolver_match
+        if match is not None and match.view_name:
+            metrics.record(match.view_name,
+                           queries=timing["queries"],
+                           db_us=int(timing["db"] * 1e6),
+                           view_us=int(view * 1e6),
+                           template_us=int(timing["template"] * 1e6))
+        return response
+
+    def process_template_response(self, request, response):
+        """Start the template clock; the response is rendered next."""
+        started = time.perf_counter()
+
+        def stop(rendered):
+            request.polls_timing["template"] += time.perf_counter() - started
+
+        response.add_post_render_callback(stop)
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_vote_count(apps, schema_editor):
+    """Fill the new counter from the existing Vote rows."""
+    Choice = apps.get_model('polls', 'Choice')
+    choices = Choice.objects.annotate(total=Count('vote'))
+    for choice in choices.iterator():
+        if choice.total:
+            Choice.objects.filter(pk=choice.pk).update(
+                vote_count=choice.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_question_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='vote_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_vote_count,
+                             migrations.RunPython.noop),
+    ]
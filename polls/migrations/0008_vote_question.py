@@ -0,0 +1,55 @@
+# Generated by Django 5.1 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+
+
+def backfill_question(apps, schema_editor):
+    """Copy the question of each vote's choice and drop duplicate votes."""
+    Choice = apps.get_model('polls', 'Choice')
+    Vote = apps.get_model('polls', 'Vote')
+    Vote.objects.update(question_id=Subquery(
+        Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')
+    ))
+    duplicates = (Vote.objects.values('user_id', 'question_id')
+                  .annotate(keep=Max('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    if not duplicates:
+        return
+    for duplicate in duplicates:
+        (Vote.objects.filter(user_id=duplicate['user_id'],
+                             question_id=duplicate['question_id'])
+         .exclude(pk=duplicate['keep']).delete())
+    # The removed duplicates were counted, so recount every choice.
+    for choice in Choice.objects.annotate(total=Count('vote')).iterator():
+        if choice.vote_count != choice.total:
+            Choice.objects.filter(pk=choice.pk).update(
+                vote_count=choice.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_choice_vote_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.RunPython(backfill_question, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vote',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='unique_vote_per_question'),
+        ),
+    ]
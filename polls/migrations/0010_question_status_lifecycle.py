@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-18 01:55
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_status(apps, schema_editor):
+    """Replace the free-text status with the one derived from the dates."""
+    Question = apps.get_model('polls', 'Question')
+    now = timezone.now()
+    today = timezone.localdate()
+    Question.objects.filter(pub_date__gt=now).update(status='scheduled')
+    Question.objects.filter(pub_date__lte=now, end_date__lt=today).update(
+        status='closed')
+    Question.objects.filter(pub_date__lte=now).exclude(
+        end_date__lt=today).update(status='open')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_question_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('open', 'Open'), ('closed', 'Closed')], default='open', editable=False, max_length=20),
+        ),
+        migrations.RunPython(set_status, migrations.RunPython.noop),
+    ]
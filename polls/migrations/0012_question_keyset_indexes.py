@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_resultsnapshot'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_pub_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_status_pub_idx',
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-pub_date', '-id'], name='question_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['status', '-pub_date', '-id'], name='question_status_pub_idx'),
+        ),
+    ]
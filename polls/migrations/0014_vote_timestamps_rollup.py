@@ -0,0 +1,68 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_question_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('votes', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='rollup_choice',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['updated_at'], name='vote_updated_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='choice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['question', 'period', 'bucket'], name='rollup_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['period', 'bucket'], name='rollup_period_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('choice', 'period', 'bucket'), name='unique_rollup_bucket'),
+        ),
+    ]
@@ -1,18 +1,73 @@
 """Import essential module."""
 import datetime
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When, Window
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 
+class QuestionQuerySet(models.QuerySet):
+    """QuerySet for filtering questions by their lifecycle status."""
+
+    def published(self):
+        """Return the questions whose pub_date has passed.
+
+        This does not wait for update_poll_status to open them.
+        """
+        return self.filter(pub_date__lte=timezone.now())
+
+    def refresh_status(self):
+        """Move questions whose dates have passed to their new status.
+
+        Return the number of questions that changed status.
+        """
+        now = timezone.now()
+        today = timezone.localdate()
+        Status = Question.Status
+        changed = self.filter(pub_date__gt=now).exclude(
+            status=Status.SCHEDULED).update(status=Status.SCHEDULED,
+                                            updated_at=now)
+        changed += self.filter(end_date__lt=today).exclude(
+            pub_date__gt=now).exclude(
+            status=Status.CLOSED).update(status=Status.CLOSED,
+                                         updated_at=now)
+        changed += self.filter(pub_date__lte=now).exclude(
+            end_date__lt=today).exclude(
+            status=Status.OPEN).update(status=Status.OPEN, updated_at=now)
+        return changed
+
+
 class Question(models.Model):
     """Question model: This model is used to store and create questions."""
 
+    class Status(models.TextChoices):
+        """Lifecycle of a question, kept up to date by update_poll_status."""
+
+        SCHEDULED = 'scheduled', 'Scheduled'
+        OPEN = 'open', 'Open'
+        CLOSED = 'closed', 'Closed'
+
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateField(null=True, blank=True)
-    status = models.CharField(max_length=20, default='active', editable=True)
+    status = models.CharField(max_length=20, choices=Status.choices,
+                              default=Status.OPEN, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        """Indexes for the published list and the status filter."""
+
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='question_pub_date_idx'),
+            models.Index(fields=['status', '-pub_date', '-id'],
+                         name='question_status_pub_idx'),
+        ]
 
     def was_published_recently(self):
         """Check whether this question has been published recently."""
@@ -29,22 +84,103 @@ class Question(models.Model):
         now = timezone.now()
         if self.end_date is None:
             return self.pub_date <= now
-        return self.pub_date <= now <= self.end_date
+        return (self.pub_date <= now
+                and timezone.localdate(now) <= self.end_date)
+
+    def current_status(self):
+        """Return the status this question should have right now."""
+        if not self.is_published():
+            return self.Status.SCHEDULED
+        if self.can_vote():
+            return self.Status.OPEN
+        return self.Status.CLOSED
+
+    def save(self, *args, **kwargs):
+        """Derive the status from the dates."""
+        # Dates may still be strings here, e.g. from create(pub_date="...").
+        self.pub_date = self._meta.get_field("pub_date").to_python(
+            self.pub_date)
+        if timezone.is_naive(self.pub_date):
+            self.pub_date = timezone.make_aware(self.pub_date)
+        self.end_date = self._meta.get_field("end_date").to_python(
+            self.end_date)
+        self.status = self.current_status()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" not in update_fields:
+            kwargs["update_fields"] = {*update_fields, "status"}
+        super().save(*args, **kwargs)
+
+    def results(self):
+        """Return the choices of this question with their vote tallies.
+
+        Every choice is annotated with ``total_votes`` (the question total)
+        and ``percentage`` in a single query.
+        """
+        return self.choice_set.with_results()
+
+    def frozen_results(self):
+        """Return the result snapshot of this closed question.
+
+        The snapshot is taken on first use; the tallies of a closed
+        question cannot change any more.
+        """
+        try:
+            return self.snapshot
+        except ResultSnapshot.DoesNotExist:
+            pass
+        # Votes cast before the end may still wait in the vote buffer.
+        from .buffer import flush_question
+        flush_question(self.id)
+        choices = [
+            {"id": choice.id, "choice_text": choice.choice_text,
+             "vote_count": choice.vote_count,
+             "percentage": choice.percentage}
+            for choice in self.results()
+        ]
+        total = sum(choice["vote_count"] for choice in choices)
+        snapshot, _ = ResultSnapshot.objects.get_or_create(
+            question=self,
+            defaults={"choices": choices, "total_votes": total})
+        return snapshot
 
     def __str__(self):
         """Return question text."""
         return self.question_text
 
 
+class ChoiceQuerySet(models.QuerySet):
+    """QuerySet with the result aggregation for choices."""
+
+    def with_results(self):
+        """Annotate each choice with the question total and its share."""
+        return self.annotate(
+            total_votes=Window(Sum("vote_count"),
+                               partition_by=[F("question_id")]),
+        ).annotate(
+            percentage=Case(
+                When(total_votes=0, then=Value(0.0)),
+                default=F("vote_count") * 100.0 / F("total_votes"),
+                output_field=FloatField(),
+            ),
+        ).order_by("id")
+
+
 class Choice(models.Model):
     """Choice model."""
 
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
+    vote_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ChoiceQuerySet.as_manager()
 
     @property
     def votes(self):
-        """Return the votes for this choice."""
+        """Return the votes for this choice from the maintained counter."""
+        return self.vote_count
+
+    def count_votes(self):
+        """Count the Vote rows for this choice (slow, used for checks)."""
         return self.vote_set.count()
 
     def __str__(self):
@@ -52,8 +188,160 @@ class Choice(models.Model):
         return self.choice_text
 
 
+class VoteQuerySet(models.QuerySet):
+    """QuerySet for casting votes."""
+
+    def cast(self, user, choice):
+        """Record the vote of a user for a choice and return the old choice id.
+
+        See cast_many().
+        """
+        previous = self.cast_many([(user.pk, choice.id, choice.question_id)])
+        return previous[user.pk, choice.question_id]
+
+    def cast_many(self, votes):
+        """Record many votes given as (user_id, choice_id, question_id).
+
+        Return {(user_id, question_id): previous choice id or None}. If a
+        user votes twice on a question, the last vote wins. The rows are
+        written with one INSERT ... ON CONFLICT DO UPDATE on the (user,
+        question) constraint and the counters with one UPDATE. The user
+        rows are locked first so that concurrent submits by the same user
+        cannot double count the vote counters.
+        """
+        votes = {(user_id, question_id): choice_id
+                 for user_id, choice_id, question_id in votes}
+        if not votes:
+            return {}
+        user_ids = sorted({user_id for user_id, _ in votes})
+        question_ids = {question_id for _, question_id in votes}
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(pk__in=user_ids)
+                 .order_by("pk").values_list("pk", flat=True))
+            existing = self.filter(user_id__in=user_ids,
+                                   question_id__in=question_ids)
+            previous = dict.fromkeys(votes)
+            for user_id, question_id, choice_id in existing.values_list(
+                    "user_id", "question_id", "choice_id"):
+                if (user_id, question_id) in votes:
+                    previous[user_id, question_id] = choice_id
+            self.bulk_create(
+                [self.model(user_id=user_id, question_id=question_id,
+                            choice_id=choice_id)
+                 for (user_id, question_id), choice_id in votes.items()],
+                update_conflicts=True,
+                unique_fields=["user", "question"],
+                update_fields=["choice", "updated_at"],
+            )
+            deltas = {}
+            for key, choice_id in votes.items():
+                if previous[key] != choice_id:
+                    deltas[choice_id] = deltas.get(choice_id, 0) + 1
+                    if previous[key] is not None:
+                        deltas[previous[key]] = deltas.get(previous[key],
+                                                           0) - 1
+            deltas = {pk: delta for pk, delta in deltas.items() if delta}
+            if deltas:
+                Choice.objects.filter(pk__in=deltas).update(
+                    vote_count=F("vote_count") + Case(
+                        *[When(pk=pk, then=Value(delta))
+                          for pk, delta in deltas.items()],
+                        output_field=models.IntegerField()))
+        return previous
+
+
 class Vote(models.Model):
     """A vote by a user for a choice in a poll."""
 
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # The choice this vote is counted for in VoteRollup; see rollup_votes.
+    rollup_choice = models.ForeignKey(Choice, on_delete=models.SET_NULL,
+                                      null=True, editable=False,
+                                      related_name="+")
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        """Only one vote per user for each question."""
+
+        constraints = [
+            models.UniqueConstraint(fields=["user", "question"],
+                                    name="unique_vote_per_question"),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"], name="vote_updated_at_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Take the question from the choice when it is not given."""
+        if self.question_id is None:
+            self.question_id = self.choice.question_id
+        super().save(*args, **kwargs)
+
+
+@receiver(post_delete, sender=Vote)
+def uncount_vote(sender, instance, **kwargs):
+    """Take a deleted vote off the counter of its choice.
+
+    Votes are also deleted with their user, question or choice, which
+    would otherwise leave the counters too high.
+    """
+    Choice.objects.filter(pk=instance.choice_id).update(
+        vote_count=F("vote_count") - 1)
+
+
+class ResultSnapshot(models.Model):
+    """Final tallies of a closed question, so they are not recomputed."""
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE,
+                                    related_name="snapshot")
+    choices = models.JSONField()
+    total_votes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Return the question text."""
+        return f"Results of {self.question}"
+
+
+class VoteRollup(models.Model):
+    """Net change of the votes of a choice in one minute or hour.
+
+    A vote adds one to its choice in the bucket of its updated_at; a
+    changed vote also takes one off its old choice there. Summing the
+    buckets up to a time gives the tallies at that time.
+    """
+
+    class Period(models.TextChoices):
+        """Length of a bucket."""
+
+        MINUTE = "minute"
+        HOUR = "hour"
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=Period.choices)
+    bucket = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        """One row per choice and bucket, read by question and time."""
+
+        constraints = [
+            models.UniqueConstraint(fields=["choice", "period", "bucket"],
+                                    name="unique_rollup_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["question", "period", "bucket"],
+                         name="rollup_question_idx"),
+            models.Index(fields=["period", "bucket"],
+                         name="rollup_period_idx"),
+        ]
+
+    def __str__(self):
+        """Return the choice, bucket and change."""
+        return f"{self.choice} {self.bucket:%Y-%m-%d %H:%M}: {self.votes:+}"
@@ -0,0 +1,125 @@
+"""Bulk loading of the data/ fixtures and of synthetic polls and votes."""
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .cache import invalidate_index
+from .models import Choice, Question, Vote
+
+DATA_DIR = Path(settings.BASE_DIR) / "data"
+FIXTURES = [DATA_DIR / name for name in
+            ("users.json", "polls-v4.json", "votes-v4.json")]
+BATCH_SIZE = 5000
+
+
+def load_fixtures(paths):
+    """Load fixture files with one bulk upsert per model.
+
+    Objects keep their primary keys and replace existing rows, like
+    loaddata, but no model is saved one by one and no signal is sent.
+    Foreign keys are checked once at the end and the primary key
+    sequences are moved past the loaded rows. Return {model: count}.
+    """
+    objects = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as fixture:
+            for item in serializers.deserialize("json", fixture,
+                                                ignorenonexistent=True):
+                objects.setdefault(type(item.object), []).append(item)
+    with transaction.atomic():
+        with connection.constraint_checks_disabled():
+            for model, items in objects.items():
+                fields = [field.name for field in model._meta.concrete_fields
+                          if not field.primary_key]
+                model.objects.bulk_create(
+                    [item.object for item in items], batch_size=BATCH_SIZE,
+                    update_conflicts=True, unique_fields=["pk"],
+                    update_fields=fields)
+                for item in items:
+                    for name, values in (item.m2m_data or {}).items():
+                        if values:
+                            getattr(item.object, name).set(values)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in objects])
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                         list(objects)):
+                cursor.execute(sql)
+        # Bulk inserts skip Question.save() and the vote counters.
+        Question.objects.refresh_status()
+        recount_votes(Choice.objects.all())
+    invalidate_index(Question)
+    return {model: len(items) for model, items in objects.items()}
+
+
+def recount_votes(choices):
+    """Set vote_count of the choices from their Vote rows."""
+    stale = [choice for choice in choices.annotate(total=Count("vote"))
+             .only("id", "vote_count") if choice.vote_count != choice.total]
+    for choice in stale:
+        choice.vote_count = choice.total
+    Choice.objects.bulk_update(stale, ["vote_count"], batch_size=BATCH_SIZE)
+
+
+def seed_synthetic(rng, questions, choices, users, votes,
+                   user_prefix="seed-user-", password="seed-password",
+                   suffix=""):
+    """Create polls modelled on the polls fixture, users and random votes.
+
+    The same ``rng`` seed gives the same polls and votes. Votes are
+    sampled without building every (user, question) pair and written in
+    batches, so millions of them fit in little memory. Return the new
+    questions, choices and users and the number of votes.
+    """
+    templates = [item["fields"] for item in
+                 json.loads((DATA_DIR / "polls-v4.json").read_text())]
+    question_texts = [fields["question_text"] for fields in templates
+                      if "question_text" in fields]
+    choice_texts = [fields["choice_text"] for fields in templates
+                    if "choice_text" in fields]
+    new_questions = Question.objects.bulk_create(
+        (Question(question_text=f"{question_texts[n % len(question_texts)]}"
+                                f" #{n}{suffix}")
+         for n in range(questions)), batch_size=BATCH_SIZE)
+    new_choices = Choice.objects.bulk_create(
+        (Choice(question=question,
+                choice_text=choice_texts[n % len(choice_texts)])
+         for question in new_questions for n in range(choices)),
+        batch_size=BATCH_SIZE)
+    # Hash once; every seeded user shares the same password.
+    password = make_password(password)
+    start = User.objects.filter(username__startswith=user_prefix).count()
+    new_users = User.objects.bulk_create(
+        (User(username=f"{user_prefix}{start + n}", password=password)
+         for n in range(users)), batch_size=BATCH_SIZE)
+    by_question = {}
+    for choice in new_choices:
+        by_question.setdefault(choice.question_id, []).append(choice.id)
+    picked = rng.sample(range(len(new_users) * len(new_questions)),
+                        min(votes, len(new_users) * len(new_questions)))
+    counts = {}
+    picked_iter = iter(picked)
+    while batch := list(islice(picked_iter, BATCH_SIZE)):
+        rows = []
+        for index in batch:
+            user = new_users[index // len(new_questions)]
+            question = new_questions[index % len(new_questions)]
+            choice_id = rng.choice(by_question[question.id])
+            counts[choice_id] = counts.get(choice_id, 0) + 1
+            rows.append(Vote(user_id=user.id, question_id=question.id,
+                             choice_id=choice_id))
+        Vote.objects.bulk_create(rows)
+    for choice in new_choices:
+        choice.vote_count = counts.get(choice.id, 0)
+    Choice.objects.bulk_update(new_choices, ["vote_count"],
+                               batch_size=BATCH_SIZE)
+    invalidate_index(Question)
+    return new_questions, new_choices, new_users, len(picked)
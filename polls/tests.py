@@ -1,10 +1,33 @@
 """Import the essential package for testing."""
 import datetime
-from django.test import TestCase
+import json
+import logging
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection
+from django.test import LiveServerTestCase, TestCase, modify_settings, \
+    override_settings
 from django.utils import timezone
 from django.urls import reverse
 
-from .models import Question
+from . import metrics
+from .admin import ApproximateCountPaginator
+from .broadcast import broadcaster
+from .buffer import VoteBuffer
+from .cache import get_index_page
+from .log import JsonFormatter, QueueListenerHandler
+from .pagination import encode_cursor, keyset_page, seek
+from .seed import FIXTURES
+from .models import Choice, Question, ResultSnapshot, Vote, VoteRollup
 
 
 class QuestionModelTests(TestCase):
@@ -46,7 +69,7 @@ class QuestionModelTests(TestCase):
         past_question = Question(pub_date=past_time)
         self.assertTrue(past_question.is_published())
 
-    def can_vote_with_end_date_passed(self):
+    def test_can_vote_with_end_date_passed(self):
         """Test end_date after end date has passed."""
         end_date = timezone.localtime().date() - datetime.timedelta(days=1)
         question = Question(
@@ -70,6 +93,47 @@ class QuestionModelTests(TestCase):
         self.assertFalse(question.can_vote())
 
 
+class QuestionStatusTests(TestCase):
+    """Tests for the question lifecycle status."""
+
+    def test_status_derived_on_save(self):
+        """Saving a question sets its status from the dates."""
+        scheduled = create_question(question_text="Later.", days=2)
+        opened = create_question(question_text="Now.", days=-2)
+        closed = Question.objects.create(
+            question_text="Done.",
+            pub_date=timezone.now() - datetime.timedelta(days=5),
+            end_date=timezone.localdate() - datetime.timedelta(days=1))
+        self.assertEqual(
+            [scheduled.status, opened.status, closed.status],
+            [Question.Status.SCHEDULED, Question.Status.OPEN,
+             Question.Status.CLOSED])
+
+    def test_update_poll_status(self):
+        """The command moves questions whose dates have passed."""
+        question = create_question(question_text="Due.", days=-1)
+        Question.objects.filter(pk=question.pk).update(
+            status=Question.Status.SCHEDULED)
+        out = StringIO()
+        call_command("update_poll_status", stdout=out)
+        question.refresh_from_db()
+        self.assertEqual(question.status, Question.Status.OPEN)
+        self.assertIn("1 question(s)", out.getvalue())
+        self.assertEqual(Question.objects.refresh_status(), 0)
+
+    def test_visible_before_status_update(self):
+        """A due poll is shown before update_poll_status has run."""
+        question = create_question(question_text="Due.", days=-1)
+        Question.objects.filter(pk=question.pk).update(
+            status=Question.Status.SCHEDULED)
+        response = self.client.get(reverse("polls:detail",
+                                           args=(question.id,)))
+        self.assertEqual(response.status_code, 200)
+        data = self.client.get(reverse("polls:api-question",
+                                       args=(question.id,))).json()
+        self.assertEqual(data["status"], Question.Status.OPEN)
+
+
 def create_question(question_text, days):
     """Create and publish a question with a `days` offset."""
     time = timezone.now() + datetime.timedelta(days=days)
@@ -79,6 +143,10 @@ def create_question(question_text, days):
 class QuestionIndexVIewTest(TestCase):
     """Tests for Question index view."""
 
+    def setUp(self):
+        """Start every test with an empty index cache."""
+        cache.clear()
+
     def test_index(self):
         """If no questions exist, an appropriate message is displayed."""
         response = self.client.get(reverse("polls:index"))
@@ -114,6 +182,82 @@ class QuestionIndexVIewTest(TestCase):
             [question2, question1],
         )
 
+    def test_index_is_cached(self):
+        """A second request is served without querying the database."""
+        create_question(question_text="Cached question.", days=-1)
+        self.client.get(reverse("polls:index"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("polls:index"))
+
+    def test_save_invalidates_index(self):
+        """Saving a question drops the cached index."""
+        question = create_question(question_text="Old text.", days=-1)
+        self.client.get(reverse("polls:index"))
+        question.question_text = "New text."
+        question.save()
+        response = self.client.get(reverse("polls:index"))
+        self.assertContains(response, "New text.")
+
+    def test_scheduled_question_expires_cache(self):
+        """The cache expires when the next scheduled question is published."""
+        Question.objects.create(
+            question_text="Soon.",
+            pub_date=timezone.now() + datetime.timedelta(hours=1))
+        with mock.patch("polls.cache.cache") as mocked_cache:
+            mocked_cache.get.return_value = None
+            get_index_page()
+        timeout = mocked_cache.set.call_args.args[2]
+        self.assertLessEqual(timeout, 3600)
+
+
+class IndexPaginationTests(TestCase):
+    """Tests for the keyset pagination and filters of the index."""
+
+    def setUp(self):
+        """Create more questions than fit on one page."""
+        cache.clear()
+        self.questions = [
+            create_question(question_text=f"Question {n}.", days=-n)
+            for n in range(1, 8)]
+
+    @override_settings(POLLS_INDEX_PAGE_SIZE=3)
+    def test_next_and_previous_pages(self):
+        """Following the cursors walks through every question once."""
+        response = self.client.get(reverse("polls:index"))
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         self.questions[:3])
+        self.assertIsNone(response.context["prev_url"])
+        response = self.client.get(reverse("polls:index")
+                                   + response.context["next_url"])
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         self.questions[3:6])
+        back = self.client.get(reverse("polls:index")
+                               + response.context["prev_url"])
+        self.assertEqual(list(back.context["latest_question_list"]),
+                         self.questions[:3])
+        response = self.client.get(reverse("polls:index")
+                                   + response.context["next_url"])
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         self.questions[6:])
+        self.assertIsNone(response.context["next_url"])
+
+    def test_deep_page_is_one_query(self):
+        """A page after a cursor is fetched with a single query."""
+        cursor = encode_cursor(self.questions[4])
+        with self.assertNumQueries(1):
+            page = keyset_page(Question.objects.published(), 2, after=cursor)
+        self.assertEqual(page.items, self.questions[5:7])
+
+    def test_text_and_status_filters(self):
+        """Questions can be searched and filtered by status."""
+        response = self.client.get(reverse("polls:index"),
+                                   {"q": "question 3", "status": "open"})
+        self.assertEqual(list(response.context["latest_question_list"]),
+                         [self.questions[2]])
+        response = self.client.get(reverse("polls:index"),
+                                   {"status": "closed"})
+        self.assertEqual(list(response.context["latest_question_list"]), [])
+
 
 class QuestionDetailViewTests(TestCase):
     """Tests for question detail view."""
@@ -125,3 +269,959 @@ class QuestionDetailViewTests(TestCase):
         url = reverse("polls:detail", args=(past_question.id,))
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+    def test_query_budget(self):
+        """The page loads the question, choices and vote exactly once."""
+        question = create_question(question_text="Budget.", days=-5)
+        for text in ("One", "Two", "Three"):
+            Choice.objects.create(question=question, choice_text=text)
+        user = User.objects.create_user(username="reader")
+        Vote.objects.create(user=user, choice=question.choice_set.first())
+        url = reverse("polls:detail", args=(question.id,))
+        # Question and its prefetched choices.
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        self.client.force_login(user)
+        # Session, user, question, choices and the user's vote.
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.context["user_vote"],
+                         question.choice_set.first().id)
+
+
+class PurgeSessionsTests(TestCase):
+    """Tests for the purge_sessions command."""
+
+    def test_only_expired_sessions_deleted(self):
+        """Expired sessions go in batches; live ones stay."""
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"old{i}", session_data="",
+                                   expire_date=now - datetime.timedelta(1))
+        Session.objects.create(session_key="live", session_data="",
+                               expire_date=now + datetime.timedelta(1))
+        out = StringIO()
+        call_command("purge_sessions", batch_size=2, stdout=out)
+        self.assertIn("Deleted 5 expired session(s).", out.getvalue())
+        self.assertQuerySetEqual(
+            Session.objects.values_list("session_key", flat=True), ["live"])
+
+
+class VoteCountTests(TestCase):
+    """Tests for the maintained per-choice vote counter."""
+
+    def setUp(self):
+        """Create a question with two choices and a voter."""
+        self.user = User.objects.create_user(username="voter",
+                                             password="password")
+        self.question = create_question(question_text="Counted.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+
+    def test_vote_updates_counter(self):
+        """Voting and changing the vote keeps the counters in step."""
+        self.client.force_login(self.user)
+        url = reverse("polls:vote", args=(self.question.id,))
+        self.client.post(url, {"choice": self.choice1.id})
+        self.client.post(url, {"choice": self.choice2.id})
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 0)
+        self.assertEqual(self.choice2.vote_count, 1)
+        self.assertEqual(self.choice2.count_votes(), 1)
+
+    def test_deleted_user_uncounted(self):
+        """Deleting a voter takes their votes off the counters."""
+        Vote.objects.cast(self.user, self.choice1)
+        self.user.delete()
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 0)
+        call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+
+    def test_rebuild_vote_counts(self):
+        """The command fixes counters that drifted from the Vote rows."""
+        Vote.objects.create(user=self.user, choice=self.choice1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+        call_command("rebuild_vote_counts", stdout=StringIO())
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.vote_count, 1)
+        call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+
+
+class QuestionResultsTests(TestCase):
+    """Tests for the aggregated results of a question."""
+
+    def setUp(self):
+        """Create a question with counted choices."""
+        self.question = create_question(question_text="Results.", days=-1)
+        Choice.objects.create(question=self.question, choice_text="A",
+                              vote_count=3)
+        Choice.objects.create(question=self.question, choice_text="B",
+                              vote_count=1)
+
+    def test_results_annotations(self):
+        """Each choice carries the total and its percentage."""
+        choices = list(self.question.results())
+        self.assertEqual([c.total_votes for c in choices], [4, 4])
+        self.assertEqual([c.percentage for c in choices], [75.0, 25.0])
+
+    def test_results_view_query_count(self):
+        """The results page fetches all tallies in a single query."""
+        url = reverse("polls:results", args=(self.question.id,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, "75.0%")
+
+
+class VoteCastTests(TestCase):
+    """Tests for the vote upsert."""
+
+    def setUp(self):
+        """Create a question with two choices and a voter."""
+        self.user = User.objects.create_user(username="caster",
+                                             password="password")
+        self.question = create_question(question_text="Upsert.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+
+    def test_cast_keeps_one_vote_per_question(self):
+        """Casting again replaces the vote instead of adding another."""
+        self.assertIsNone(Vote.objects.cast(self.user, self.choice1))
+        self.assertEqual(Vote.objects.cast(self.user, self.choice2),
+                         self.choice1.id)
+        self.assertEqual(Vote.objects.cast(self.user, self.choice2),
+                         self.choice2.id)
+        vote = Vote.objects.get(user=self.user)
+        self.assertEqual(vote.choice, self.choice2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 1))
+
+    def test_unique_vote_per_question(self):
+        """The database rejects a second vote row for the same question."""
+        Vote.objects.create(user=self.user, choice=self.choice1)
+        with self.assertRaises(IntegrityError):
+            Vote.objects.create(user=self.user, choice=self.choice2)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot lookups so that index regressions show up."""
+
+    def assertUsesIndex(self, queryset, index_name):
+        """Assert that the query plan of the queryset uses the index."""
+        if connection.vendor == "postgresql":
+            # Tiny test tables would otherwise be scanned sequentially.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index_name, queryset.explain())
+
+    def test_index_pages_use_index(self):
+        """The first and later index pages use the pub_date index."""
+        published = Question.objects.published()
+        size = settings.POLLS_INDEX_PAGE_SIZE + 1
+        key = (timezone.now(), 10)
+        for queryset in (seek(published), seek(published, key),
+                         seek(published, key, backwards=True)):
+            with self.subTest(query=str(queryset.query)):
+                self.assertUsesIndex(queryset[:size], "question_pub_date_idx")
+
+    def test_status_filter_uses_index(self):
+        """Index pages filtered by status use the status index."""
+        published = Question.objects.published()
+        size = settings.POLLS_INDEX_PAGE_SIZE + 1
+        key = (timezone.now(), 10)
+        for status in (Question.Status.OPEN, Question.Status.CLOSED):
+            queryset = published.filter(status=status)
+            for page in (seek(queryset), seek(queryset, key)):
+                with self.subTest(status=status, query=str(page.query)):
+                    self.assertUsesIndex(page[:size],
+                                         "question_status_pub_idx")
+
+    def test_user_vote_lookup_uses_index(self):
+        """The user's vote for a question is found through the constraint."""
+        if connection.vendor == "sqlite":
+            index_name = "sqlite_autoindex_polls_vote_1"
+        else:
+            index_name = "unique_vote_per_question"
+        queryset = Vote.objects.filter(user_id=1, question_id=1)
+        self.assertUsesIndex(queryset, index_name)
+
+
+class ImportVotesTests(TestCase):
+    """Tests for the import_votes command."""
+
+    def setUp(self):
+        """Create two voters and a question with two choices."""
+        self.alice = User.objects.create_user(username="alice")
+        self.bob = User.objects.create_user(username="bob")
+        self.question = create_question(question_text="Imported.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+
+    def import_file(self, name, content, *args):
+        """Write the content to a temporary file and import it."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / name
+            path.write_text(content)
+            call_command("import_votes", str(path), *args, stdout=StringIO())
+
+    def test_import_jsonl(self):
+        """Votes are imported in batches; the last vote of a user wins."""
+        lines = [
+            {"user": "alice", "choice": self.choice1.id},
+            {"user": self.bob.id, "choice": self.choice1.id},
+            {"user": "alice", "choice": self.choice2.id},
+            {"user": "nobody", "choice": self.choice2.id},
+        ]
+        content = "\n".join(json.dumps(line) for line in lines)
+        self.import_file("votes.jsonl", content, "--batch-size", "2")
+        self.assertEqual(Vote.objects.get(user=self.alice).choice,
+                         self.choice2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (1, 1))
+
+    def test_import_csv(self):
+        """Votes can be imported from a CSV file with a header."""
+        content = f"user,choice\nbob,{self.choice2.id}\n"
+        self.import_file("votes.csv", content)
+        self.assertEqual(Vote.objects.get(user=self.bob).choice, self.choice2)
+
+    def test_numeric_usernames(self):
+        """Student-ID usernames are names; user_id columns are ids."""
+        student = User.objects.create_user(username=str(self.alice.id))
+        content = (f"user,user_id,choice\n{student.username},,"
+                   f"{self.choice1.id}\n,{self.bob.id},{self.choice2.id}\n")
+        self.import_file("votes.csv", content)
+        self.assertEqual(
+            dict(Vote.objects.values_list("user", "choice")),
+            {student.id: self.choice1.id, self.bob.id: self.choice2.id})
+
+    def test_import_fixture(self):
+        """A .json file is read as a fixture of polls.vote objects."""
+        content = json.dumps([
+            {"model": "polls.vote", "pk": 1,
+             "fields": {"choice": self.choice1.id,
+                        "question": self.question.id, "user": self.bob.id}},
+            {"model": "polls.vote", "pk": 2,
+             "fields": {"choice": self.choice2.id,
+                        "question": self.question.id,
+                        "user": self.alice.id}},
+        ], indent=2)
+        self.import_file("votes.json", content)
+        self.assertEqual(
+            dict(Vote.objects.values_list("user", "choice")),
+            {self.bob.id: self.choice1.id, self.alice.id: self.choice2.id})
+
+    def test_invalid_files(self):
+        """Malformed records stop the import with a CommandError."""
+        for name, content in (
+                ("votes.jsonl", f'{{"user": "bob", "choice": '
+                                f'{self.choice1.id}}}\nnot json\n'),
+                ("votes.jsonl", "[1]\n"),
+                ("votes.json", '{"model": "polls.vote"}'),
+                ("votes.json", '[{"model": "polls.choice", "fields": {}}]'),
+                ("votes.txt", "")):
+            with self.subTest(name=name, content=content):
+                with self.assertRaises(CommandError):
+                    self.import_file(name, content)
+
+
+class ResultsStreamTests(TestCase):
+    """Tests for the live results stream."""
+
+    def setUp(self):
+        """Create a question with one counted choice."""
+        self.question = create_question(question_text="Live.", days=-1)
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text="One", vote_count=2)
+
+    def test_broadcast_reaches_subscribers(self):
+        """A published change is delivered to every subscriber."""
+        async def listen():
+            first = broadcaster.subscribe(self.question.id)
+            second = broadcaster.subscribe(self.question.id)
+            await sync_to_async(broadcaster.publish)(self.question.id,
+                                                     {self.choice.id})
+            events = [await first.get(), await second.get()]
+            broadcaster.unsubscribe(self.question.id, first)
+            broadcaster.unsubscribe(self.question.id, second)
+            return events
+
+        events = async_to_sync(listen)()
+        expected = {str(self.choice.id): 2}
+        self.assertEqual(events, [expected, expected])
+        self.assertFalse(broadcaster.has_subscribers(self.question.id))
+
+    def test_stream_starts_with_tally(self):
+        """The stream opens with the full tally of the question."""
+        async def first_event():
+            url = reverse("polls:results-stream", args=(self.question.id,))
+            response = await self.async_client.get(url)
+            content = response.streaming_content
+            event = await anext(content)
+            await content.aclose()
+            return response, event
+
+        response, event = async_to_sync(first_event)()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(
+            event, f'event: tally\ndata: {{"{self.choice.id}": 2}}\n\n'.encode())
+
+    @mock.patch("polls.views.RESULTS_STREAM_KEEPALIVE", 0.01)
+    def test_stream_rereads_tally(self):
+        """Votes from other processes arrive when the stream is idle."""
+        async def second_event():
+            url = reverse("polls:results-stream", args=(self.question.id,))
+            content = (await self.async_client.get(url)).streaming_content
+            await anext(content)
+            await Choice.objects.filter(pk=self.choice.pk).aupdate(
+                vote_count=3)
+            event = await anext(content)
+            await content.aclose()
+            return event
+
+        self.assertEqual(
+            async_to_sync(second_event)(),
+            f'event: delta\ndata: {{"{self.choice.id}": 3}}\n\n'.encode())
+
+    def test_no_stream_under_wsgi(self):
+        """A WSGI server neither links nor serves the stream."""
+        url = reverse("polls:results-stream", args=(self.question.id,))
+        self.assertEqual(self.client.get(url).status_code, 204)
+        response = self.client.get(reverse("polls:results",
+                                           args=(self.question.id,)))
+        self.assertFalse(response.context["stream"])
+        self.assertNotContains(response, "EventSource")
+
+
+class LoggingTests(TestCase):
+    """Tests for the queued, structured logging."""
+
+    def test_json_formatter_includes_extra(self):
+        """Extra fields of a record end up in the JSON line."""
+        record = logging.makeLogRecord({
+            "name": "polls.events", "levelname": "INFO", "msg": "User %s",
+            "args": ("alice",), "event": "login", "user": 1})
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "User alice")
+        self.assertEqual((data["event"], data["user"]), ("login", 1))
+
+    def test_queue_handler_writes_in_background(self):
+        """Records pass through the queue to the target handler."""
+        stream = StringIO()
+        target = logging.StreamHandler(stream)
+        handler = QueueListenerHandler([target])
+        test_logger = logging.getLogger("polls.tests.queue")
+        test_logger.addHandler(handler)
+        try:
+            test_logger.warning("queued")
+        finally:
+            test_logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(stream.getvalue(), "queued\n")
+
+
+class PoolStatsTests(TestCase):
+    """Tests for the connection pool statistics view."""
+
+    def test_staff_only(self):
+        """Visitors who are not staff are sent to the admin login."""
+        response = self.client.get(reverse("polls:pool-stats"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_reports_pool(self):
+        """Staff get the pool statistics as JSON."""
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("polls:pool-stats"))
+        pool = getattr(connection, "pool", None)
+        self.assertEqual(response.json()["pooled"], pool is not None)
+
+
+class BenchmarkTests(LiveServerTestCase):
+    """Run a tiny benchmark against the live test server."""
+
+    def test_benchmark_reports_every_endpoint(self):
+        """The benchmark seeds data and reports a line per endpoint."""
+        out = StringIO()
+        call_command("benchmark", "--seed", "--url", self.live_server_url,
+                     "--questions", "2", "--choices", "2", "--users", "2",
+                     "--votes", "2", "--requests", "4", "--concurrency", "1",
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[-4:]],
+                         ["index", "detail", "results", "vote"])
+        self.assertEqual([line.split()[6] for line in lines[-4:]],
+                         ["0", "0", "0", "0"])
+
+
+@modify_settings(MIDDLEWARE={
+    "prepend": "polls.middleware.RequestMetricsMiddleware"})
+class RequestMetricsTests(TestCase):
+    """Tests for the request metrics middleware."""
+
+    def setUp(self):
+        """Start from empty counters."""
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        """Every response carries the query count and timings."""
+        question = create_question(question_text="Timed.", days=-1)
+        response = self.client.get(reverse("polls:results",
+                                           args=(question.id,)))
+        timing = response["Server-Timing"]
+        self.assertIn('desc="2 queries"', timing)
+        for name in ("db;", "view;", "tpl;", "total;"):
+            self.assertIn(name, timing)
+
+    def test_counters_per_url_name(self):
+        """Requests are added up per URL name and shown by the command."""
+        self.client.get(reverse("polls:index"))
+        self.client.get(reverse("polls:index"))
+        totals = metrics.snapshot()["polls:index"]
+        self.assertEqual(totals["requests"], 2)
+        out = StringIO()
+        with mock.patch.object(metrics, "is_shared", return_value=True):
+            call_command("request_metrics", "--reset", stdout=out)
+        self.assertIn("polls:index", out.getvalue())
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_local_cache_points_to_page(self):
+        """Counters in a per-process cache are read from the JSON page."""
+        with self.assertRaisesMessage(CommandError, "/polls/stats/requests/"):
+            call_command("request_metrics", stdout=StringIO())
+
+    def test_cleared_cache(self):
+        """Counting starts again after the cache was cleared."""
+        self.client.get(reverse("polls:index"))
+        cache.clear()
+        self.client.get(reverse("polls:index"))
+        self.assertEqual(metrics.snapshot()["polls:index"]["requests"], 1)
+
+
+class FrozenResultsTests(TestCase):
+    """Tests for the result snapshots of closed polls."""
+
+    def setUp(self):
+        """Create a closed question with a counted choice."""
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Closed.",
+            pub_date=timezone.now() - datetime.timedelta(days=5),
+            end_date=timezone.localdate() - datetime.timedelta(days=1))
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text="Final",
+                                            vote_count=4)
+        self.url = reverse("polls:results", args=(self.question.id,))
+
+    def test_closed_results_served_from_snapshot(self):
+        """After the first view the results need no database queries."""
+        response = self.client.get(self.url)
+        self.assertContains(response, "100.0%")
+        self.assertIn("max-age", response["Cache-Control"])
+        Choice.objects.filter(pk=self.choice.pk).update(vote_count=9)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["total_votes"], 4)
+
+    def test_etag_not_modified(self):
+        """A matching If-None-Match gets a 304 response."""
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_reopening_drops_snapshot(self):
+        """A new end_date reopens the question and forgets the snapshot."""
+        self.client.get(self.url)
+        self.question.end_date = None
+        self.question.save()
+        self.assertFalse(ResultSnapshot.objects.exists())
+        response = self.client.get(self.url)
+        self.assertTrue(response.context["live"])
+
+    @override_settings(POLLS_SNAPSHOT_CACHE_TIMEOUT=0)
+    def test_reopened_elsewhere(self):
+        """Without the cache entry a poll reopened by another worker is live.
+
+        The invalidation signal only reaches the cache of the process that
+        saved the question; other processes wait for the timeout.
+        """
+        response = self.client.get(self.url)
+        self.assertIn("max-age=0", response["Cache-Control"])
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=None, status=Question.Status.OPEN)
+        ResultSnapshot.objects.all().delete()
+        response = self.client.get(self.url)
+        self.assertTrue(response.context["live"])
+
+    def test_closed_poll_rejects_votes(self):
+        """Votes for a closed poll are not recorded."""
+        user = User.objects.create_user(username="late")
+        self.client.force_login(user)
+        self.client.post(reverse("polls:vote", args=(self.question.id,)),
+                         {"choice": self.choice.id})
+        self.assertFalse(Vote.objects.exists())
+
+
+class ApiTests(TestCase):
+    """Tests for the JSON API."""
+
+    def setUp(self):
+        """Create a question with two choices and a voter."""
+        cache.clear()
+        self.question = create_question(question_text="API.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+        self.user = User.objects.create_user(username="client")
+
+    def test_list_and_detail(self):
+        """Questions are listed and fetched with their choices."""
+        response = self.client.get(reverse("polls:api-questions"))
+        self.assertEqual([q["id"] for q in response.json()["results"]],
+                         [self.question.id])
+        response = self.client.get(reverse("polls:api-question",
+                                           args=(self.question.id,)))
+        self.assertEqual([c["choice_text"] for c in response.json()[
+            "choices"]], ["One", "Two"])
+        self.assertIn("Last-Modified", response)
+
+    def test_results_not_modified_until_vote(self):
+        """The results ETag holds until a vote changes the tallies."""
+        url = reverse("polls:api-results", args=(self.question.id,))
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        Vote.objects.cast(self.user, self.choice1)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_votes"], 1)
+
+    def test_json_vote(self):
+        """A logged-in client can vote with a JSON POST."""
+        url = reverse("polls:api-vote", args=(self.question.id,))
+        response = self.client.post(url, {"choice": self.choice1.id},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        self.client.force_login(self.user)
+        response = self.client.post(url, {"choice": self.choice2.id},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["previous_choice"], None)
+        for body in ('{"choice": "x"}', '{"choice": 1e400}'):
+            response = self.client.post(url, body,
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Vote.objects.get(user=self.user).choice,
+                         self.choice2)
+
+
+class BatchVoteTests(TestCase):
+    """Tests for the batch vote endpoint."""
+
+    def setUp(self):
+        """Create a kiosk account, voters and an open and closed poll."""
+        self.kiosk = User.objects.create_user(username="kiosk",
+                                              is_superuser=True)
+        self.alice = User.objects.create_user(username="alice")
+        self.bob = User.objects.create_user(username="bob")
+        self.question = create_question(question_text="Kiosk.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+        self.closed = Question.objects.create(
+            question_text="Closed.",
+            pub_date=timezone.now() - datetime.timedelta(days=5),
+            end_date=timezone.localdate() - datetime.timedelta(days=1))
+        self.closed_choice = Choice.objects.create(question=self.closed,
+                                                   choice_text="Late")
+        self.url = reverse("polls:api-batch-vote")
+
+    def post(self, votes):
+        """Send a batch of votes."""
+        return self.client.post(self.url, {"votes": votes},
+                                content_type="application/json")
+
+    def test_permission_required(self):
+        """Only accounts allowed to add votes can submit a batch."""
+        self.client.force_login(self.alice)
+        self.assertEqual(self.post([]).status_code, 403)
+
+    def test_batch_results_per_item(self):
+        """Valid votes are saved together; each item gets a result."""
+        Vote.objects.cast(self.bob, self.choice1)
+        self.client.force_login(self.kiosk)
+        q = self.question.id
+        response = self.post([
+            {"user": "alice", "question": q, "choice": self.choice1.id},
+            {"user": self.bob.id, "question": q, "choice": self.choice2.id},
+            {"user": "alice", "question": q, "choice": self.choice2.id},
+            {"user": "nobody", "question": q, "choice": self.choice1.id},
+            {"user": "alice", "question": self.closed.id,
+             "choice": self.closed_choice.id},
+            {"user": "alice", "question": q,
+             "choice": self.closed_choice.id},
+        ])
+        statuses = [item["status"] for item in response.json()["results"]]
+        self.assertEqual(statuses, ["superseded", "updated", "created",
+                                    "error", "error", "error"])
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (0, 2))
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_numeric_username_is_not_an_id(self):
+        """A string is always a username, even when it looks like an id."""
+        student = User.objects.create_user(username=str(self.alice.id))
+        self.client.force_login(self.kiosk)
+        self.post([{"user": student.username, "question": self.question.id,
+                    "choice": self.choice1.id}])
+        self.assertEqual(Vote.objects.get().user, student)
+
+    def test_malformed_batch(self):
+        """Items that are not vote objects are rejected with a 400."""
+        self.client.force_login(self.kiosk)
+        for body in ('{"votes": [1]}', '{"votes": {"a": 1}}',
+                     '{"votes": [{"user": "alice", "question": 1e400, '
+                     '"choice": 1}]}'):
+            with self.subTest(body=body):
+                response = self.client.post(self.url, body,
+                                            content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+
+
+class VoteBufferTests(TestCase):
+    """Tests for the write-behind vote buffer."""
+
+    def setUp(self):
+        """Create a voter, a poll and a journal file."""
+        self.user = User.objects.create_user(username="voter")
+        self.question = create_question(question_text="Burst.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "votes.sqlite3")
+
+    def test_vote_is_buffered(self):
+        """A vote waits in the journal; the newest one per poll wins."""
+        with override_settings(POLLS_VOTE_BUFFER=self.path):
+            self.client.force_login(self.user)
+            url = reverse("polls:vote", args=(self.question.id,))
+            self.client.post(url, {"choice": self.choice1.id})
+            self.client.post(url, {"choice": self.choice2.id})
+        self.assertFalse(Vote.objects.exists())
+        vote_buffer = VoteBuffer(self.path)
+        self.assertEqual(len(vote_buffer), 1)
+        self.assertEqual(vote_buffer.pending_choice(self.user.id,
+                                                    self.question.id),
+                         self.choice2.id)
+
+    def test_flush_after_restart(self):
+        """A new buffer on the same file writes out what was left."""
+        VoteBuffer(self.path).append(self.user.id, self.question.id,
+                                     self.choice1.id)
+        with override_settings(POLLS_VOTE_BUFFER=self.path):
+            call_command("flush_vote_buffer", stdout=StringIO())
+        self.assertEqual(len(VoteBuffer(self.path)), 0)
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 1)
+        self.assertEqual(Vote.objects.get().choice, self.choice1)
+
+    def test_flushed_before_freezing(self):
+        """Buffered votes are counted in the frozen results of the poll."""
+        VoteBuffer(self.path).append(self.user.id, self.question.id,
+                                     self.choice1.id)
+        Question.objects.filter(pk=self.question.pk).update(
+            end_date=timezone.localdate() - datetime.timedelta(days=1))
+        cache.clear()
+        with override_settings(POLLS_VOTE_BUFFER=self.path):
+            response = self.client.get(reverse("polls:results",
+                                               args=(self.question.id,)))
+        self.assertEqual(response.context["total_votes"], 1)
+        self.assertEqual(len(VoteBuffer(self.path)), 0)
+
+    def test_database_error_keeps_votes(self):
+        """Votes stay in the journal when the database is unavailable."""
+        vote_buffer = VoteBuffer(self.path)
+        vote_buffer.append(self.user.id, self.question.id, self.choice1.id)
+        other = User.objects.create_user(username="other")
+        vote_buffer.append(other.id, self.question.id, self.choice2.id)
+        with mock.patch.object(Vote.objects, "cast_many",
+                               side_effect=OperationalError("gone")):
+            with self.assertRaises(OperationalError):
+                vote_buffer.flush()
+        self.assertEqual(len(vote_buffer), 2)
+        self.assertEqual(vote_buffer.flush(), 2)
+        self.assertEqual(len(vote_buffer), 0)
+
+    def test_integrity_error_drops_only_failing_votes(self):
+        """A vote that breaks a constraint is dropped, the others written."""
+        vote_buffer = VoteBuffer(self.path)
+        vote_buffer.append(self.user.id, self.question.id, self.choice1.id)
+        other = User.objects.create_user(username="other")
+        vote_buffer.append(other.id, self.question.id, self.choice2.id)
+        cast_many = Vote.objects.cast_many
+
+        def fail_for_other(votes):
+            votes = list(votes)
+            if any(user_id == other.id for user_id, _, _ in votes):
+                raise IntegrityError("deleted")
+            return cast_many(votes)
+
+        with mock.patch.object(Vote.objects, "cast_many",
+                               side_effect=fail_for_other):
+            with self.assertLogs("polls.buffer", logging.ERROR):
+                self.assertEqual(vote_buffer.flush(), 2)
+        self.assertEqual(len(vote_buffer), 0)
+        self.assertEqual(Vote.objects.get().user, self.user)
+
+
+class AdminTests(TestCase):
+    """Tests for the admin changelists."""
+
+    def setUp(self):
+        """Log in a superuser and create a poll with votes."""
+        self.admin = User.objects.create_superuser(username="admin")
+        self.client.force_login(self.admin)
+        self.question = create_question(question_text="Admin.", days=-1)
+        for text in ("One", "Two"):
+            choice = Choice.objects.create(question=self.question,
+                                           choice_text=text)
+        for i in range(3):
+            user = User.objects.create_user(username=f"voter{i}")
+            Vote.objects.cast(user, choice)
+
+    def test_question_vote_totals(self):
+        """The question list shows the vote total of each question."""
+        response = self.client.get(reverse("admin:polls_question_changelist"))
+        self.assertEqual(
+            response.context["cl"].result_list.get().total_votes, 3)
+
+    def test_vote_changelist_queries(self):
+        """Votes are listed with their relations in one query."""
+        url = reverse("admin:polls_vote_changelist")
+        self.client.get(url)
+        # Session, user, count and the votes joined with their user and
+        # choice, plus the row estimate on PostgreSQL.
+        with self.assertNumQueries(4 + (connection.vendor == "postgresql")):
+            response = self.client.get(url)
+        self.assertContains(response, "voter2")
+
+    def test_approximate_count(self):
+        """Big unfiltered lists use the estimate; filtered ones count."""
+        with mock.patch.object(ApproximateCountPaginator, "estimate",
+                               return_value=10 ** 6):
+            votes = ApproximateCountPaginator(Vote.objects.all(), 10)
+            self.assertEqual(votes.count, 10 ** 6)
+            mine = ApproximateCountPaginator(
+                Vote.objects.filter(user__username="voter0"), 10)
+            self.assertEqual(mine.count, 1)
+
+    @skipUnless(connection.vendor == "postgresql", "needs pg_class")
+    def test_postgresql_estimate(self):
+        """On PostgreSQL the estimate comes from pg_class."""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE polls_vote")
+        with mock.patch.object(ApproximateCountPaginator, "exact_limit", 0):
+            paginator = ApproximateCountPaginator(Vote.objects.all(), 10)
+            with self.assertNumQueries(1) as queries:
+                self.assertEqual(paginator.count, 3)
+        self.assertIn("pg_class", queries.captured_queries[0]["sql"])
+
+
+class ExportTests(TestCase):
+    """Tests for the result and vote exports."""
+
+    def setUp(self):
+        """Create a poll with two votes."""
+        self.question = create_question(question_text="Export.", days=-1)
+        self.choice = Choice.objects.create(question=self.question,
+                                            choice_text="Yes, please")
+        for name in ("ann", "ben"):
+            Vote.objects.cast(User.objects.create_user(username=name),
+                              self.choice)
+
+    def test_command_csv(self):
+        """The command writes a header and one CSV line per vote."""
+        out = StringIO()
+        call_command("export_polls", "votes", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0],
+                         "id,question,choice,user,created_at,updated_at")
+        self.assertEqual([line.split(",")[3] for line in lines[1:]],
+                         ["ann", "ben"])
+
+    def test_command_columns(self):
+        """Column chunks hold a list per column."""
+        out = StringIO()
+        call_command("export_polls", "votes", format="columns",
+                     chunk_size=1, stdout=out)
+        chunks = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([chunk["user"] for chunk in chunks],
+                         [["ann"], ["ben"]])
+
+    def test_view_streams_for_staff(self):
+        """Staff download a streamed CSV; others are sent to log in."""
+        url = reverse("polls:export", args=("results",))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        self.assertIn('"Yes, please",2', body)
+
+    def test_view_streams_under_asgi(self):
+        """Under ASGI the export is an async stream, not a list in memory."""
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        url = reverse("polls:export", args=("votes",))
+
+        async def download():
+            await self.async_client.aforce_login(staff)
+            response = await self.async_client.get(url)
+            return response, [line async for line
+                              in response.streaming_content]
+
+        response, lines = async_to_sync(download)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(lines), 3)
+
+
+class VoteRollupTests(TestCase):
+    """Tests for the vote rollups and the trend API."""
+
+    def setUp(self):
+        """Create a poll with two choices and two votes."""
+        self.question = create_question(question_text="Trend.", days=-1)
+        self.choice1 = Choice.objects.create(question=self.question,
+                                             choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question,
+                                             choice_text="Two")
+        self.users = [User.objects.create_user(username=name)
+                      for name in ("ann", "ben")]
+        for user in self.users:
+            Vote.objects.cast(user, self.choice1)
+
+    def rollup(self):
+        """Run the rollup command."""
+        call_command("rollup_votes", stdout=StringIO())
+
+    def test_vote_timestamps(self):
+        """A changed vote keeps created_at and moves updated_at."""
+        vote = Vote.objects.get(user=self.users[0])
+        Vote.objects.cast(self.users[0], self.choice2)
+        changed = Vote.objects.get(pk=vote.pk)
+        self.assertEqual(changed.created_at, vote.created_at)
+        self.assertGreater(changed.updated_at, vote.updated_at)
+
+    def test_incremental_rollup(self):
+        """Changed votes move between choices; reruns count nothing twice."""
+        self.rollup()
+        Vote.objects.cast(self.users[0], self.choice2)
+        self.rollup()
+        self.rollup()
+        for period in VoteRollup.Period.values:
+            totals = [sum(VoteRollup.objects.filter(
+                choice=choice, period=period).values_list("votes", flat=True))
+                for choice in (self.choice1, self.choice2)]
+            self.assertEqual(totals, [1, 1])
+
+    def test_trend_api(self):
+        """The trend ends at the current tallies, read from the rollups."""
+        self.rollup()
+        url = reverse("polls:api-trend", args=(self.question.id,))
+        with self.assertNumQueries(3):
+            data = self.client.get(url, {"period": "minute"}).json()
+        self.assertEqual(data["buckets"][-1]["totals"], [2, 0])
+        self.assertEqual(self.client.get(url, {"period": "day"}).status_code,
+                         400)
+
+
+class SeedDataTests(TestCase):
+    """Tests for the seed_data command."""
+
+    def test_load_fixtures(self):
+        """The data/ fixtures load with counters, statuses and sequences."""
+        call_command("seed_data", stdout=StringIO())
+        call_command("seed_data", stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 3)
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(
+            sum(Choice.objects.values_list("vote_count", flat=True)), 2)
+        # New rows get ids after the loaded ones.
+        self.assertGreater(create_question("New.", days=-1).id, 3)
+
+    def test_loaddata(self):
+        """The fixtures carry the timestamps loaddata does not fill in."""
+        call_command("loaddata", *(str(path) for path in FIXTURES),
+                     stdout=StringIO())
+        self.assertEqual(Question.objects.filter(
+            updated_at__isnull=False).count(), 3)
+        self.assertEqual(Vote.objects.filter(
+            created_at__isnull=False).count(), 2)
+
+    def test_synthetic_is_deterministic(self):
+        """The same random seed casts the same votes."""
+        def seed():
+            call_command("seed_data", "--synthetic", "--questions", "3",
+                         "--users", "4", "--votes", "6", stdout=StringIO())
+            votes = list(Vote.objects.order_by("id").values_list(
+                "user__username", "question__question_text",
+                "choice__choice_text"))
+            call_command("rebuild_vote_counts", "--check", stdout=StringIO())
+            Vote.objects.all().delete()
+            Question.objects.all().delete()
+            User.objects.all().delete()
+            return votes
+        first = seed()
+        self.assertEqual(len(first), 6)
+        self.assertEqual(seed(), first)
+
+
+class PasswordHasherTests(TestCase):
+    """Tests for the password hasher profiles."""
+
+    def test_rehash_on_login(self):
+        """A password is rehashed with the profile's hasher at login."""
+        profiles = settings.PASSWORD_HASHER_PROFILES
+        with override_settings(PASSWORD_HASHERS=profiles["default"]):
+            user = User.objects.create_user(username="old", password="pw")
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+        with override_settings(PASSWORD_HASHERS=profiles["scrypt"]):
+            self.assertTrue(self.client.login(username="old", password="pw"))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+
+    def test_fast_passwords_survive_switch(self):
+        """Users hashed under the fast profile log in under the others."""
+        profiles = settings.PASSWORD_HASHER_PROFILES
+        with override_settings(PASSWORD_HASHERS=profiles["fast"]):
+            user = User.objects.create_user(username="load", password="pw")
+        self.assertTrue(user.password.startswith("md5$"))
+        with override_settings(PASSWORD_HASHERS=profiles["default"]):
+            self.assertTrue(self.client.login(username="load",
+                                              password="pw"))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+
+    def test_benchmark_login(self):
+        """The login benchmark reports each profile and leaves no user."""
+        out = StringIO()
+        call_command("benchmark_login", "--requests", "2", "--profiles",
+                     "fast", "scrypt", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]],
+                         ["fast", "scrypt"])
+        self.assertFalse(User.objects.exists())
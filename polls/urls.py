@@ -1,12 +1,27 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = "polls"
 urlpatterns = [
     path("", views.IndexView.as_view(), name="index"),
     path("<int:pk>/", views.DetailView.as_view(), name="detail"),
     path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
+    path("<int:pk>/results/stream/", views.results_stream,
+         name="results-stream"),
     path("<int:question_id>/vote/", views.vote, name="vote"),
+    path("api/questions/", api.question_list, name="api-questions"),
+    path("api/questions/<int:pk>/", api.question_detail,
+         name="api-question"),
+    path("api/questions/<int:pk>/results/", api.question_results,
+         name="api-results"),
+    path("api/questions/<int:pk>/results/trend/", api.question_trend,
+         name="api-trend"),
+    path("api/questions/<int:pk>/vote/", api.question_vote,
+         name="api-vote"),
+    path("api/votes/batch/", api.batch_vote, name="api-batch-vote"),
+    path("stats/pool/", views.pool_stats, name="pool-stats"),
+    path("stats/requests/", views.request_metrics, name="request-metrics"),
+    path("export/<str:name>/", views.export, name="export"),
 
 ]
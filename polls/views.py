@@ -1,13 +1,25 @@
 """Import every django essential package."""
+import asyncio
 
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404, render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, \
+    HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.shortcuts import aget_object_or_404, get_object_or_404, render
 from django.urls import reverse
 from django.views import generic
-from django.utils import timezone
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connection, transaction
+from . import metrics
+from .broadcast import broadcaster, format_event
+from .buffer import get_vote_buffer
+from .cache import cache_snapshot, get_cached_snapshot, get_index_page
+from .export import EXPORTS, FORMATS, aexport_lines, export_lines
 from .models import Choice, Question, Vote
+from .pagination import keyset_page
 from django.shortcuts import redirect
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
@@ -18,6 +30,11 @@ from django.dispatch import receiver
 from django.http import Http404
 
 logger = logging.getLogger(__name__)
+event_logger = logging.getLogger("polls.events")
+
+# Seconds between re-reads of the tally on an idle results stream. Votes
+# cast in other server processes reach the viewer this way.
+RESULTS_STREAM_KEEPALIVE = 15
 
 
 class IndexView(generic.ListView):
@@ -25,12 +42,49 @@ class IndexView(generic.ListView):
 
     template_name = 'polls/index.html'
     context_object_name = "latest_question_list"
-    ordered_questions = Question.objects.order_by('-pub_date')
 
     def get_queryset(self):
-        """Return the last five published questions."""
-        return Question.objects.filter(pub_date__lte=timezone.now()).order_by(
-            "-pub_date")[:5]
+        """Return one page of published questions, newest first.
+
+        The page is found with keyset pagination (the ``after`` and
+        ``before`` cursors) and can be filtered by ``status`` and ``q``.
+        The unfiltered first page comes from the cache.
+        """
+        params = self.request.GET
+        status = params.get("status")
+        text = params.get("q", "").strip()
+        after, before = params.get("after"), params.get("before")
+        if not (status or text or after or before):
+            self.page = get_index_page()
+            return self.page.items
+        questions = Question.objects.published()
+        if status in (Question.Status.OPEN, Question.Status.CLOSED):
+            questions = questions.filter(status=status)
+        if text:
+            questions = questions.filter(question_text__icontains=text)
+        self.page = keyset_page(questions, settings.POLLS_INDEX_PAGE_SIZE,
+                                after=after, before=before)
+        return self.page.items
+
+    def get_context_data(self, **kwargs):
+        """Add the filters and the links to the next and previous pages."""
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        context["statuses"] = [Question.Status.OPEN, Question.Status.CLOSED]
+        context["next_url"] = self.page_url(after=self.page.next_cursor)
+        context["prev_url"] = self.page_url(before=self.page.prev_cursor)
+        return context
+
+    def page_url(self, **cursor):
+        """Return the query string of a neighbour page, or None."""
+        name, value = next(iter(cursor.items()))
+        if value is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[name] = value
+        return f"?{params.urlencode()}"
 
 
 class DetailView(generic.DetailView):
@@ -41,22 +95,21 @@ class DetailView(generic.DetailView):
 
     def get_queryset(self):
         """Excludes any questions that aren't published yet."""
-        return Question.objects.filter(pub_date__lte=timezone.now())
+        return Question.objects.published().prefetch_related('choice_set')
 
     def get_context_data(self, **kwargs):
         """To return the past vote of the user."""
         context = super().get_context_data(**kwargs)
-        question = self.get_object()
 
         # Get the current user's vote for this question, if it exists
         if self.request.user.is_authenticated:
-            try:
-                vote = Vote.objects.get(user=self.request.user,
-                                        choice__question=question)
-                context[
-                    'user_vote'] = vote.choice.id
-            except Vote.DoesNotExist:
-                context['user_vote'] = None
+            vote_buffer = get_vote_buffer()
+            pending = vote_buffer and vote_buffer.pending_choice(
+                self.request.user.id, self.object.id)
+            context['user_vote'] = pending or (
+                Vote.objects.filter(user=self.request.user,
+                                    question=self.object)
+                .values_list('choice_id', flat=True).first())
 
         return context
 
@@ -65,17 +118,18 @@ class DetailView(generic.DetailView):
         try:
             # Try to get the object. If it doesn't exist, it will raise
             # Http404.
-            question = self.get_object()
+            self.object = self.get_object()
         except Http404:
             messages.error(request, "The requested poll does not exist.")
             return redirect('polls:index')
 
-        if not question.can_vote():
+        if not self.object.can_vote():
             messages.error(request, "Voting is not allowed for this poll.")
             return redirect('polls:index')
 
-        # If everything is fine, proceed to the default behavior.
-        return super().get(request, *args, **kwargs)
+        # If everything is fine, render the question fetched above.
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
 
 
 class ResultsView(generic.DetailView):
@@ -83,16 +137,143 @@ class ResultsView(generic.DetailView):
 
     model = Question
     template_name = "polls/results.html"
+    snapshot = None
+
+    def get(self, request, *args, **kwargs):
+        """Serve closed polls from their frozen snapshot with an ETag."""
+        self.snapshot = get_cached_snapshot(kwargs["pk"])
+        if self.snapshot is not None:
+            self.object = self.snapshot.question
+        else:
+            self.object = self.get_object()
+            if self.object.current_status() == Question.Status.CLOSED:
+                self.snapshot = self.object.frozen_results()
+                cache_snapshot(self.snapshot)
+        if self.snapshot is None:
+            context = self.get_context_data(object=self.object)
+            return self.render_to_response(context)
+
+        # The page only changes with the user (logout button) or a message.
+        etag = (f'"results-{self.object.id}-'
+                f'{int(self.snapshot.created_at.timestamp())}"')
+        has_messages = bool(messages.get_messages(request))
+        if not has_messages and etag in request.headers.get(
+                "If-None-Match", ""):
+            return HttpResponseNotModified()
+        context = self.get_context_data(object=self.object)
+        response = self.render_to_response(context)
+        if not has_messages:
+            response["ETag"] = etag
+            patch_cache_control(response, private=True,
+                                max_age=settings.POLLS_SNAPSHOT_CACHE_TIMEOUT)
+            patch_vary_headers(response, ["Cookie"])
+        return response
+
+    def get_context_data(self, **kwargs):
+        """Add every choice with its tally, computed in one query."""
+        context = super().get_context_data(**kwargs)
+        if self.snapshot is not None:
+            context["choices"] = self.snapshot.choices
+            context["total_votes"] = self.snapshot.total_votes
+            context["live"] = context["stream"] = False
+            return context
+        choices = list(self.object.results())
+        context["choices"] = choices
+        context["total_votes"] = choices[0].total_votes if choices else 0
+        context["live"] = True
+        # Only ASGI servers can hold the stream open without a thread each.
+        context["stream"] = isinstance(self.request, ASGIRequest)
+        return context
+
+
+async def results_stream(request, pk):
+    """Stream the tallies of a question as Server-Sent Events.
+
+    The first ``tally`` event carries every choice, later ``delta`` events
+    only the choices whose count changed. Votes cast in this process are
+    pushed at once; the others show up when the tally is read again after
+    RESULTS_STREAM_KEEPALIVE idle seconds. Under WSGI the stream would
+    hold a server thread forever, so it answers 204 and the browser does
+    not reconnect.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    question = await aget_object_or_404(Question, pk=pk)
+
+    async def read_tally():
+        return {str(choice_id): votes async for choice_id, votes in
+                question.choice_set.values_list("id", "vote_count")}
+
+    async def events():
+        queue = broadcaster.subscribe(question.id)
+        try:
+            sent = await read_tally()
+            yield format_event("tally", sent)
+            while True:
+                try:
+                    delta = await asyncio.wait_for(
+                        queue.get(), RESULTS_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    tally = await read_tally()
+                    delta = {choice_id: votes
+                             for choice_id, votes in tally.items()
+                             if sent.get(choice_id) != votes}
+                    if not delta:
+                        yield ": keep-alive\n\n"
+                        continue
+                sent.update(delta)
+                yield format_event("delta", delta)
+        finally:
+            broadcaster.unsubscribe(question.id, queue)
+
+    response = StreamingHttpResponse(events(),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def record_vote(user, choice):
+    """Cast the vote of a user and tell the live results about it.
+
+    Return the id of the choice the user voted for before, or None.
+    """
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        # Write-behind: only read the old vote, the buffer writes it later.
+        previous = vote_buffer.pending_choice(user.id, choice.question_id)
+        if previous is None:
+            previous = (Vote.objects.filter(
+                user=user, question_id=choice.question_id)
+                .values_list("choice_id", flat=True).first())
+        vote_buffer.append(user.id, choice.question_id, choice.id)
+        event_logger.info("User %s voted", user.username, extra={
+            "event": "vote", "user": user.id,
+            "question": choice.question_id, "choice": choice.id,
+            "previous_choice": previous, "buffered": True})
+        return previous
+    # Upsert the user's vote; the counters are updated in the same
+    # transaction
+    previous = Vote.objects.cast(user, choice)
+    transaction.on_commit(lambda: broadcaster.publish(
+        choice.question_id, {previous, choice.id} - {None}))
+    event_logger.info("User %s voted", user.username, extra={
+        "event": "vote", "user": user.id, "question": choice.question_id,
+        "choice": choice.id, "previous_choice": previous})
+    return previous
 
 
 @login_required
 def vote(request, question_id):
     """Handle voting on a question."""
     question = get_object_or_404(Question, pk=question_id)
+    if not question.can_vote():
+        messages.error(request, "Voting is not allowed for this poll.")
+        return redirect('polls:index')
     try:
         selected_choice = question.choice_set.get(pk=request.POST["choice"])
     except (KeyError, Choice.DoesNotExist):
-        logger.error("An error occurred while updating the vote")
+        logger.warning("Vote submitted without a valid choice")
         return render(
             request,
             "polls/detail.html",
@@ -101,31 +282,51 @@ def vote(request, question_id):
                 "error_message": "You didn't select a choice.",
             },
         )
-    # Reference to the user
-    this_user = request.user
-    print("current user is", this_user.id, "login", this_user.username)
-    print("Real name:", this_user.first_name, this_user.last_name)
-    logger.info('User has submitted a vote')
-    # Get user's vote
-    try:
-        # vote = this_user.vote_set.get(choice__question=question)
-        vote = Vote.objects.get(user=this_user, choice__question=question)
+    previous = record_vote(request.user, selected_choice)
+    if previous is not None:
         # User has a vote for this question! Update his choice.
-        vote.choice = selected_choice
-        vote.save()
         messages.success(request,
                          f"Your vote was updated to "
                          f"'{selected_choice.choice_text}'")
-    except Vote.DoesNotExist:
-        logger.error("An error occurred while updating the vote")
-        vote = Vote.objects.create(user=this_user, choice=selected_choice)
+    else:
         # Does not have to vote yet
-        # Auto save
         messages.success(request,
                          f"Your voted for '{selected_choice.choice_text}'")
     return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
 
+@staff_member_required
+def pool_stats(request):
+    """Report the database connection pool statistics of this process."""
+    pool = getattr(connection, "pool", None)
+    if pool is None:
+        return JsonResponse({"pooled": False})
+    return JsonResponse({"pooled": True, "stats": pool.get_stats()})
+
+
+@staff_member_required
+def request_metrics(request):
+    """Report the per-URL query and timing counters as JSON."""
+    return JsonResponse(metrics.snapshot())
+
+
+@staff_member_required
+def export(request, name):
+    """Stream an export as a download; ``?format=columns`` for chunks."""
+    output_format = request.GET.get("format", "csv")
+    if name not in EXPORTS or output_format not in FORMATS:
+        raise Http404("No such export.")
+    content_type, extension = FORMATS[output_format]
+    if isinstance(request, ASGIRequest):
+        lines = aexport_lines(name, output_format)
+    else:
+        lines = export_lines(name, output_format)
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response["Content-Disposition"] = \
+        f'attachment; filename="{name}.{extension}"'
+    return response
+
+
 def signup(request):
     """Register a new user."""
     if request.method == 'POST':
@@ -152,21 +353,25 @@ def signup(request):
 def log_user_login(sender, request, user, **kwargs):
     """Use signals to log data into the log file."""
     ip_add = get_client_ip(request)
-    logger.info(f"User {user.username} logged in. IP: {ip_add}")
+    event_logger.info("User %s logged in", user.username, extra={
+        "event": "login", "user": user.id, "ip": ip_add})
 
 
 @receiver(user_logged_out)
 def log_user_logout(sender, request, user, **kwargs):
     """Use a signal when the user logs out to log all relevant information."""
-    logger.info(f"User {user.username} logged out")
+    event_logger.info("User %s logged out", user.username, extra={
+        "event": "logout", "user": user.id})
 
 
 @receiver(user_login_failed)
 def log_unsuccessful_login(sender, credentials, request, **kwargs):
     """Use signal from failed login attempt to log."""
-    logger.warning(
-        f"Unsuccessful login attempt for username: "
-        f"{credentials.get('username')}")
+    event_logger.warning(
+        "Unsuccessful login attempt for username: %s",
+        credentials.get('username'), extra={
+            "event": "login_failed", "username": credentials.get('username'),
+            "ip": get_client_ip(request) if request else None})
 
 
 def get_client_ip(request):
@@ -0,0 +1,31 @@
+"""Identify the voters named in imported and batched votes."""
+from django.contrib.auth.models import User
+
+
+def user_key(record):
+    """Return ("id", pk) or ("username", name) for the voter of a record.
+
+    ``user_id`` holds a primary key and ``username`` a username. A plain
+    ``user`` is a primary key only when it is a JSON number, so numeric
+    usernames such as student IDs are still looked up by name.
+    """
+    if record.get("user_id") not in (None, ""):
+        return "id", int(record["user_id"])
+    if record.get("username") not in (None, ""):
+        return "username", str(record["username"]).strip()
+    user = record["user"]
+    if isinstance(user, int) and not isinstance(user, bool):
+        return "id", user
+    return "username", str(user).strip()
+
+
+def resolve_users(keys):
+    """Return {key: user id} for the keys of user_key() that exist."""
+    ids = {value for kind, value in keys if kind == "id"}
+    names = {value for kind, value in keys if kind == "username"}
+    users = {("id", pk): pk for pk in
+             User.objects.filter(pk__in=ids).values_list("pk", flat=True)}
+    users.update((("username", username), pk) for pk, username in
+                 User.objects.filter(username__in=names)
+                 .values_list("pk", "username"))
+    return users